@@ -1,6 +1,48 @@
 import React, { useState, useEffect } from 'react';
 import './App.css';
 
+const removeName = (names, name) => {
+  const index = names.indexOf(name);
+  if (index !== -1) {
+    names.splice(index, 1);
+  }
+};
+
+// Applies a /mealcount/stream delta (one student's choice changing) to the meal counts payload
+const applyMealCountDelta = (counts, delta) => {
+  if (!counts || counts.date !== delta.date) {
+    return counts;
+  }
+  const next = {
+    ...counts,
+    veg_students: [...counts.veg_students],
+    non_veg_students: [...counts.non_veg_students],
+    caffeine: { ...counts.caffeine },
+    caffeine_students: Object.fromEntries(
+      Object.entries(counts.caffeine_students).map(([type, students]) => [type, [...students]])
+    ),
+  };
+  const mealStudents = (choice) => (choice.veg_or_nonveg === 'Veg' ? next.veg_students : next.non_veg_students);
+
+  if (delta.previous) {
+    removeName(mealStudents(delta.previous), delta.previous.name);
+    if (next.caffeine_students[delta.previous.caffeine_choice]) {
+      removeName(next.caffeine_students[delta.previous.caffeine_choice], delta.previous.name);
+    }
+  }
+  mealStudents(delta.current).push(delta.current.name);
+  if (next.caffeine_students[delta.current.caffeine_choice]) {
+    next.caffeine_students[delta.current.caffeine_choice].push(delta.current.name);
+  }
+
+  next.veg = next.veg_students.length;
+  next.non_veg = next.non_veg_students.length;
+  Object.keys(next.caffeine).forEach((type) => {
+    next.caffeine[type] = next.caffeine_students[type].length;
+  });
+  return next;
+};
+
 function App() {
   const [activeView, setActiveView] = useState('mealCounts'); // 'mealCounts' or 'editMenu'
   const [weekday, setWeekday] = useState('Monday');
@@ -12,16 +54,36 @@ function App() {
   });
   const [message, setMessage] = useState('');
   const [mealCounts, setMealCounts] = useState(null);
+  const [weekMenus, setWeekMenus] = useState(null); // weekday -> menu, loaded once per visit to the edit view
 
   const API_BASE_URL = import.meta.env.VITE_API_BASE_URL;
 
   useEffect(() => {
-    if (activeView === 'mealCounts') {
-      fetchMealCounts();
-    } else if (activeView === 'editMenu') {
-      fetchMenuForWeekday(weekday);
+    if (activeView === 'editMenu') {
+      fetchWeekMenus();
+    }
+  }, [activeView]); // Load the whole week when the edit view opens; weekday switches read from it
+
+  useEffect(() => {
+    if (activeView !== 'mealCounts') {
+      return undefined;
     }
-  }, [activeView, weekday]); // Re-fetch when view changes or weekday changes
+    // The stream starts with a full snapshot, then sends one delta per changed student choice
+    const source = new EventSource(`${API_BASE_URL}/mealcount/stream`);
+    source.addEventListener('snapshot', (event) => {
+      setMealCounts(JSON.parse(event.data));
+      setMessage('');
+    });
+    source.addEventListener('delta', (event) => {
+      const delta = JSON.parse(event.data);
+      setMealCounts((prevCounts) => applyMealCountDelta(prevCounts, delta));
+    });
+    source.onerror = () => {
+      // EventSource reconnects on its own and receives a fresh snapshot
+      console.error('Meal count stream interrupted, reconnecting...');
+    };
+    return () => source.close();
+  }, [activeView]); // Subscribe while the meal counts view is open
 
   const fetchMealCounts = async () => {
     try {
@@ -51,38 +113,42 @@ function App() {
     }
   };
 
-  const fetchMenuForWeekday = async (selectedWeekday) => {
+  const emptyMenu = {
+    breakfast: '',
+    lunch: '',
+    snacks: '',
+    dinner: '',
+  };
+
+  const showMenuForWeekday = (menus, selectedWeekday) => {
+    const data = menus[selectedWeekday];
+    if (data) {
+      setMenu({
+        breakfast: data.breakfast || '',
+        lunch: data.lunch || '',
+        snacks: data.snacks || '',
+        dinner: data.dinner || '',
+      });
+      setMessage(''); // Clear message when the day has a menu
+    } else {
+      setMenu(emptyMenu);
+      setMessage(`No menu found for ${selectedWeekday}. You can create one.`);
+    }
+  };
+
+  const fetchWeekMenus = async () => {
     try {
-      const response = await fetch(`${API_BASE_URL}/menu/${selectedWeekday}`);
-      if (response.ok) {
-        const data = await response.json();
-        setMenu({
-          breakfast: data.breakfast || '',
-          lunch: data.lunch || '',
-          snacks: data.snacks || '',
-          dinner: data.dinner || '',
-        });
-        setMessage(''); // Clear message on successful fetch
-      } else if (response.status === 404) {
-        setMenu({
-          breakfast: '',
-          lunch: '',
-          snacks: '',
-          dinner: '',
-        });
-        setMessage(`No menu found for ${selectedWeekday}. You can create one.`);
-      } else {
+      const response = await fetch(`${API_BASE_URL}/menus`);
+      if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
+      const data = await response.json();
+      const menus = Object.fromEntries(data.map((dayMenu) => [dayMenu.weekday, dayMenu]));
+      setWeekMenus(menus);
+      showMenuForWeekday(menus, weekday);
     } catch (error) {
-      console.error('Error fetching menu:', error);
-      // Check if the error is an HTTP error and not a 404
-      if (error.response && error.response.status && error.response.status !== 404) {
-          setMessage('Error fetching menu.');
-      } else if (!error.response) { // Catch network errors or other non-HTTP errors
-          setMessage('Error fetching menu: Network or server issue.');
-      }
-      // If it's a 404, the message is already set by the else if (response.status === 404) block
+      console.error('Error fetching menus:', error);
+      setMessage('Error fetching menus: Network or server issue.');
     }
   };
 
@@ -109,15 +175,42 @@ function App() {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
       const data = await response.json();
+      // Keep the loaded week in sync without re-fetching it
+      setWeekMenus((prevMenus) => ({ ...prevMenus, [weekday]: { ...menu, weekday } }));
       setMessage(data.message);
-      // After saving, re-fetch the menu to ensure consistency
-      fetchMenuForWeekday(weekday); 
     } catch (error) {
       console.error('Error submitting menu:', error);
       setMessage('Error submitting menu.');
     }
   };
 
+  const handleImportMenus = async (e) => {
+    const file = e.target.files[0];
+    e.target.value = ''; // Allow re-selecting the same file
+    if (!file) {
+      return;
+    }
+    setMessage('');
+    try {
+      const response = await fetch(`${API_BASE_URL}/menus`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'text/csv',
+        },
+        body: await file.text(),
+      });
+      const data = await response.json();
+      if (!response.ok) {
+        throw new Error(data.detail || `HTTP error! status: ${response.status}`);
+      }
+      await fetchWeekMenus();
+      setMessage(data.message);
+    } catch (error) {
+      console.error('Error importing menus:', error);
+      setMessage(`Error importing menus: ${error.message}`);
+    }
+  };
+
   return (
     <div className="App">
       <div className="dashboard-container">
@@ -245,7 +338,9 @@ function App() {
                 <label htmlFor="weekday-select">Weekday:</label>
                 <select id="weekday-select" value={weekday} onChange={(e) => {
                   setWeekday(e.target.value);
-                  // fetchMenuForWeekday is already called by useEffect when weekday changes
+                  if (weekMenus) {
+                    showMenuForWeekday(weekMenus, e.target.value);
+                  }
                 }}>
                   {['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'].map(
                     (day) => (
@@ -300,6 +395,10 @@ function App() {
               </div>
               <button type="submit" className="full-width-button">Save Menu</button>
             </form>
+            <div className="form-group full-width">
+              <label htmlFor="menu-import-input">Import week from CSV (weekday,breakfast,lunch,snacks,dinner; blank cells keep the current meal):</label>
+              <input type="file" id="menu-import-input" accept=".csv,text/csv" onChange={handleImportMenus} />
+            </div>
             {message && <p>{message}</p>}
           </section>
         )}
@@ -1,14 +1,31 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
+from decimal import Decimal
+import asyncio
+import csv
 import datetime # Import datetime
 import asyncpg
+import hashlib
+import io
+import json
+import logging
+import time
 import traceback
 import os
+import pytz
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware # Import CORSMiddleware
+from brotli_asgi import BrotliMiddleware # Brotli with gzip fallback
+from dataclasses import asdict
+from tickets import InvalidTicket, MissingTicketSecret, verify_ticket
+import queries
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 from fastapi.middleware.cors import CORSMiddleware # Import CORSMiddleware
 
 app = FastAPI()
@@ -23,11 +40,77 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
-# Database connection function
-async def get_db_connection():
-    return await asyncpg.connect(os.getenv("DATABASE_URL"))
+# Compress larger JSON bodies (meal counts carry every student's name).
+# The event stream is excluded: compressors buffer output and would hold back events.
+app.add_middleware(
+    BrotliMiddleware,
+    minimum_size=1000,
+    gzip_fallback=True,
+    excluded_handlers=["^/mealcount/stream$"],
+)
+
+# --- Conditional GET support --- #
+
+# Versions are bumped by triggers in the database (see migrations/0002_table_versions.sql).
+# They are cached here for a few seconds so repeated If-None-Match requests
+# can be answered with a 304 without opening a database connection.
+TABLE_VERSION_TTL = 5 # seconds
+CACHE_CONTROL = "no-cache" # Clients may store responses but must revalidate with the ETag
+_table_versions = {} # table_name -> (version, fetched_at)
+
+async def get_table_versions(*table_names):
+    now = time.monotonic()
+    stale = [
+        name for name in table_names
+        if name not in _table_versions or now - _table_versions[name][1] > TABLE_VERSION_TTL
+    ]
+    if stale:
+        versions = await queries.get_table_versions(stale)
+        for name in stale:
+            _table_versions[name] = (versions.get(name, 0), now)
+    return [_table_versions[name][0] for name in table_names]
+
+def invalidate_table_versions(*table_names):
+    for name in table_names:
+        _table_versions.pop(name, None)
+
+def response_coding(request: Request) -> str:
+    # The content coding BrotliMiddleware will pick for this request
+    accept_encoding = request.headers.get("accept-encoding", "")
+    if "br" in accept_encoding:
+        return "br"
+    if "gzip" in accept_encoding:
+        return "gzip"
+    return "identity"
+
+def make_etag(request: Request, *parts):
+    # Strong validators must differ per content coding, so br/gzip responses get their own tag
+    digest = hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()
+    coding = response_coding(request)
+    return f'"{digest[:20]}"' if coding == "identity" else f'"{digest[:20]}-{coding}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison as required for If-None-Match (RFC 9110, 13.1.2)
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+def set_cache_headers(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    response.headers["Vary"] = "Accept-Encoding" # The ETag depends on it even when the body is not compressed
+
+def not_modified(etag: str) -> Response:
+    response = Response(status_code=304)
+    set_cache_headers(response, etag)
+    return response
 
 @app.get("/test-db")
 async def test_db():
@@ -50,52 +133,35 @@ async def test_db():
 
 class Menu(BaseModel):
     weekday: str
-    breakfast: str = None
-    lunch: str = None
-    snacks: str = None
-    dinner: str = None
+    breakfast: Optional[str] = None
+    lunch: Optional[str] = None
+    snacks: Optional[str] = None
+    dinner: Optional[str] = None
+
+    def to_day_menu(self) -> queries.DayMenu:
+        return queries.DayMenu(self.weekday, self.breakfast, self.lunch, self.snacks, self.dinner)
 
 @app.post("/menu")
 async def create_or_update_menu(menu: Menu):
-    conn = None
     try:
-        conn = await get_db_connection()
-        await conn.execute(
-            """
-            INSERT INTO menus (weekday, breakfast, lunch, snacks, dinner)
-            VALUES ($1, $2, $3, $4, $5)
-            ON CONFLICT (weekday) DO UPDATE SET
-                breakfast = EXCLUDED.breakfast,
-                lunch = EXCLUDED.lunch,
-                snacks = EXCLUDED.snacks,
-                dinner = EXCLUDED.dinner
-            """,
-            menu.weekday, menu.breakfast, menu.lunch, menu.snacks, menu.dinner
-        )
+        await queries.upsert_menus([menu.to_day_menu()])
+        invalidate_table_versions("menus")
         return {"message": f"Menu for {menu.weekday} created/updated successfully."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            await conn.close()
 
 @app.get("/menu/{weekday}")
-async def get_menu(weekday: str):
-    conn = None
+async def get_menu(weekday: str, request: Request, response: Response):
     try:
-        conn = await get_db_connection()
-        row = await conn.fetchrow(
-            "SELECT breakfast, lunch, snacks, dinner FROM menus WHERE weekday = $1",
-            weekday
-        )
-        if row:
-            return {
-                "weekday": weekday,
-                "breakfast": row["breakfast"],
-                "lunch": row["lunch"],
-                "snacks": row["snacks"],
-                "dinner": row["dinner"]
-            }
+        (menus_version,) = await get_table_versions("menus")
+        etag = make_etag(request, "menu", weekday, menus_version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        menu = await queries.get_menu(weekday)
+        if menu:
+            set_cache_headers(response, etag)
+            return asdict(menu)
         raise HTTPException(status_code=404, detail=f"Menu for {weekday} not found.")
     except asyncpg.exceptions.PostgresError as e:
         # Catch specific PostgreSQL errors if needed, otherwise re-raise as 500
@@ -105,88 +171,589 @@ async def get_menu(weekday: str):
     except Exception as e:
         # Catch other unexpected errors
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
-    finally:
-        if conn:
-            await conn.close()
+
+# --- Weekly menus --- #
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+MENU_FIELDS = ["weekday", "breakfast", "lunch", "snacks", "dinner"]
+
+def parse_menus_csv(body: str):
+    # Expects a header row with the MENU_FIELDS columns. Empty cells come back as None,
+    # which import_menus leaves out of the update so the stored meal is kept.
+    reader = csv.DictReader(io.StringIO(body))
+    menus = []
+    for row in reader:
+        values = {field: (row.get(field) or "").strip() for field in MENU_FIELDS}
+        menus.append(Menu(**{field: value for field, value in values.items() if value}))
+    return menus
+
+@app.post("/menus")
+async def import_menus(request: Request):
+    # Accepts a JSON list of menus or a CSV upload (Content-Type: text/csv)
+    content_type = request.headers.get("content-type", "")
+    is_csv = content_type.startswith("text/csv")
+    try:
+        if is_csv:
+            menus = parse_menus_csv((await request.body()).decode("utf-8-sig"))
+        else:
+            menus = [Menu(**item) for item in await request.json()]
+    except (ValueError, TypeError) as e: # Malformed JSON/CSV or fields failing validation
+        raise HTTPException(status_code=400, detail=f"Invalid menu upload: {e}")
+
+    if not menus:
+        raise HTTPException(status_code=400, detail="No menus found in upload.")
+    for menu in menus:
+        menu.weekday = (menu.weekday or "").strip().capitalize()
+        if menu.weekday not in WEEKDAYS:
+            raise HTTPException(status_code=400, detail=f"Unknown weekday: {menu.weekday!r}.")
+    weekdays = [menu.weekday for menu in menus]
+    if len(set(weekdays)) != len(weekdays):
+        raise HTTPException(status_code=400, detail="Each weekday may appear only once.")
+
+    try:
+        # One multi-row upsert for the whole week
+        # Blank CSV cells keep the current meal; in JSON a null (or left out) meal clears it
+        await queries.upsert_menus([menu.to_day_menu() for menu in menus], keep_missing=is_csv)
+        invalidate_table_versions("menus")
+        return {"message": f"Menus for {len(menus)} day(s) imported successfully.", "weekdays": weekdays}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/menus")
+async def get_menus(request: Request, response: Response):
+    try:
+        (menus_version,) = await get_table_versions("menus")
+        etag = make_etag(request, "menus", menus_version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        menus = {menu.weekday: asdict(menu) for menu in await queries.list_menus()}
+
+        set_cache_headers(response, etag)
+        # Days without a menu are left out; the rest come back in week order
+        return [menus[day] for day in WEEKDAYS if day in menus]
+    except asyncpg.exceptions.PostgresError as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+
+# --- Meal counts --- #
+
+CAFFEINE_OPTIONS = ["Tea", "Coffee", "Black Coffee", "Black Tea", "None"]
+
+def count_entry(name, choice: queries.MealChoice):
+    return {"name": name, "veg_or_nonveg": choice.veg_or_nonveg, "caffeine_choice": choice.caffeine_choice}
+
+async def fetch_student_choices(conn, date):
+    # student_id -> {"name", "veg_or_nonveg", "caffeine_choice"} for every registered student
+    return {
+        student.id: count_entry(student.name, choice)
+        for student, choice in await queries.list_students_with_choices(date, conn=conn)
+    }
+
+def summarize_meal_counts(date, choices):
+    veg_students = []
+    non_veg_students = []
+    caffeine_students = {option: [] for option in CAFFEINE_OPTIONS}
+
+    for choice in choices.values():
+        if choice["veg_or_nonveg"] == "Veg":
+            veg_students.append(choice["name"])
+        elif choice["veg_or_nonveg"] == "Non-Veg":
+            non_veg_students.append(choice["name"])
+        if choice["caffeine_choice"] in caffeine_students:
+            caffeine_students[choice["caffeine_choice"]].append(choice["name"])
+
+    return {
+        "date": date.strftime("%Y-%m-%d"),
+        "veg": len(veg_students),
+        "non_veg": len(non_veg_students),
+        "veg_students": veg_students,
+        "non_veg_students": non_veg_students,
+        "caffeine": {option: len(students) for option, students in caffeine_students.items()},
+        "caffeine_students": caffeine_students
+    }
 
 @app.get("/mealcount/tomorrow")
-async def get_meal_counts_tomorrow():
-    conn = None
+async def get_meal_counts_tomorrow(request: Request, response: Response):
     try:
-        conn = await get_db_connection()
         tomorrow = datetime.date.today() + datetime.timedelta(days=1)
-        tomorrow_weekday = tomorrow.strftime("%A")
-
-        # Initialize counts and lists for students
-        veg_count = 0
-        non_veg_count = 0
-        caffeine_counts = {"Tea": 0, "Coffee": 0, "Black Coffee": 0, "Black Tea": 0, "None": 0}
-        veg_students = []
-        non_veg_students = []
-        caffeine_students = {"Tea": [], "Coffee": [], "Black Coffee": [], "Black Tea": [], "None": []}
-
-        # Fetch all students
-        students = await conn.fetch("SELECT id, name, tg_user_id FROM students")
-
-        for student in students:
-            student_id = student["id"]
-            student_name = student["name"]
-            
-            # 1. Check for today's meal choice (made yesterday)
-            meal_choice = await conn.fetchrow(
-                "SELECT veg_or_nonveg, caffeine_choice FROM meal_choices WHERE student_id = $1 AND date = $2",
-                student_id, tomorrow # tomorrow's meal choice is given today
-            )
 
-            veg_or_nonveg = None
-            caffeine_choice = None
-
-            if meal_choice:
-                veg_or_nonveg = meal_choice["veg_or_nonveg"] if meal_choice["veg_or_nonveg"] is not None else "Non-Veg"
-                caffeine_choice = meal_choice["caffeine_choice"] if meal_choice["caffeine_choice"] is not None else "None"
-            else:
-                # 2. Else check weekly choice
-                weekly_choice = await conn.fetchrow(
-                    "SELECT veg_or_nonveg, caffeine_choice FROM weekly_choices WHERE student_id = $1 AND weekday = $2",
-                    student_id, tomorrow_weekday
-                )
-                if weekly_choice:
-                    veg_or_nonveg = weekly_choice["veg_or_nonveg"] if weekly_choice["veg_or_nonveg"] is not None else "Non-Veg"
-                    caffeine_choice = weekly_choice["caffeine_choice"] if weekly_choice["caffeine_choice"] is not None else "None"
-                else:
-                    # 3. Else default to Non-Veg
-                    veg_or_nonveg = "Non-Veg"
-                    caffeine_choice = "None"
-            
-            # Aggregate counts and student names
-            if veg_or_nonveg == "Veg":
-                veg_count += 1
-                veg_students.append(student_name)
-            elif veg_or_nonveg == "Non-Veg":
-                non_veg_count += 1
-                non_veg_students.append(student_name)
-            
-            if caffeine_choice in caffeine_counts:
-                caffeine_counts[caffeine_choice] += 1
-                caffeine_students[caffeine_choice].append(student_name)
+        versions = await get_table_versions("students", "meal_choices", "weekly_choices")
+        etag = make_etag(request, "mealcount", tomorrow, *versions)
+        if etag_matches(request, etag):
+            return not_modified(etag)
 
-        return {
-            "date": tomorrow.strftime("%Y-%m-%d"),
-            "veg": veg_count,
-            "non_veg": non_veg_count,
-            "veg_students": veg_students,
-            "non_veg_students": non_veg_students,
-            "caffeine": caffeine_counts,
-            "caffeine_students": caffeine_students
-        }
+        async with queries.acquire() as conn:
+            choices = await fetch_student_choices(conn, tomorrow) # tomorrow's meal choice is given today
+
+        set_cache_headers(response, etag)
+        return summarize_meal_counts(tomorrow, choices)
 
     except Exception as e:
         full_traceback = traceback.format_exc()
         print(f"Caught exception in /mealcount/tomorrow: {e}\n{full_traceback}")
         raise HTTPException(status_code=500, detail=f"Exception: {str(e)}\nTraceback:\n{full_traceback}")
-    finally:
-        if conn:
-            await conn.close()
+
+# --- Live meal counts (server-sent events) --- #
+
+# bot.py sends a NOTIFY on queries.MEALCOUNT_CHANNEL whenever it upserts meal_choices or
+# weekly_choices, or registers a student. A single LISTEN connection is shared by every
+# dashboard subscribed to /mealcount/stream.
+SSE_HEARTBEAT_SECONDS = 15
+SSE_CLIENT_QUEUE_SIZE = 100 # Events buffered per client before it is treated as too slow
+
+_stream_subscribers = set() # One asyncio.Queue per connected client
+_stream_notifications = asyncio.Queue() # Raw NOTIFY payloads waiting for the worker
+_stream_lock = asyncio.Lock() # Serializes use of the listener connection and snapshot
+_stream_listener = None
+_stream_worker = None
+_stream_snapshot = {"date": None, "choices": {}}
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def close_subscriber(queue):
+    # Drop whatever is buffered and leave only the close marker; EventSource reconnects
+    # on its own and the new connection starts from a fresh snapshot.
+    _stream_subscribers.discard(queue)
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(None)
+
+def broadcast(event, data):
+    message = format_sse(event, data)
+    for queue in list(_stream_subscribers):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            close_subscriber(queue)
+
+def on_choice_notification(connection, pid, channel, payload):
+    _stream_notifications.put_nowait(payload)
+
+def on_listener_terminated(connection):
+    global _stream_listener, _stream_worker
+    logger.warning("Meal count listener connection lost; disconnecting stream clients.")
+    _stream_listener = None
+    if _stream_worker:
+        _stream_worker.cancel()
+        _stream_worker = None
+    _stream_snapshot["date"] = None
+    for queue in list(_stream_subscribers):
+        close_subscriber(queue)
+
+async def refresh_stream_snapshot():
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+    if _stream_snapshot["date"] != tomorrow:
+        _stream_snapshot["choices"] = await fetch_student_choices(_stream_listener, tomorrow)
+        _stream_snapshot["date"] = tomorrow
+        return True
+    return False
+
+async def handle_choice_notification(payload):
+    change = json.loads(payload)
+    invalidate_table_versions(change["table"])
+
+    if await refresh_stream_snapshot():
+        # The day rolled over; everyone gets the new day's full counts
+        broadcast("snapshot", summarize_meal_counts(_stream_snapshot["date"], _stream_snapshot["choices"]))
+        return
+
+    date = _stream_snapshot["date"]
+    if change["table"] != "students" and change.get("date") != date.isoformat() and change.get("weekday") != date.strftime("%A"):
+        return # The change does not affect tomorrow's counts
+
+    student_id = change["student_id"]
+    previous = _stream_snapshot["choices"].get(student_id)
+    if previous is None:
+        student = await queries.get_student(student_id, conn=_stream_listener)
+        if student is None:
+            return
+        name = student.name
+        invalidate_table_versions("students")
+    else:
+        name = previous["name"]
+
+    current = count_entry(name, await queries.resolve_choice(student_id, date, conn=_stream_listener))
+    if current == previous:
+        return
+    _stream_snapshot["choices"][student_id] = current
+    broadcast("delta", {
+        "date": date.strftime("%Y-%m-%d"),
+        "student_id": student_id,
+        "previous": previous,
+        "current": current,
+    })
+
+async def check_stream_rollover():
+    # Runs when no notification arrived for a heartbeat interval, so dashboards left
+    # open past midnight move on to the new "tomorrow" without waiting for a choice change
+    if _stream_subscribers and await refresh_stream_snapshot():
+        broadcast("snapshot", summarize_meal_counts(_stream_snapshot["date"], _stream_snapshot["choices"]))
+
+async def run_stream_worker():
+    while True:
+        try:
+            payload = await asyncio.wait_for(_stream_notifications.get(), timeout=SSE_HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            payload = None
+        try:
+            async with _stream_lock:
+                if _stream_listener is None:
+                    continue
+                if payload is None:
+                    await check_stream_rollover()
+                else:
+                    await handle_choice_notification(payload)
+        except Exception:
+            logger.exception("Error handling meal choice notification %r.", payload)
+
+async def subscribe_to_meal_counts():
+    global _stream_listener, _stream_worker
+    async with _stream_lock:
+        if _stream_listener is None:
+            _stream_listener = await queries.connect()
+            _stream_listener.add_termination_listener(on_listener_terminated)
+            await _stream_listener.add_listener(queries.MEALCOUNT_CHANNEL, on_choice_notification)
+            _stream_worker = asyncio.create_task(run_stream_worker())
+        await refresh_stream_snapshot()
+        queue = asyncio.Queue(maxsize=SSE_CLIENT_QUEUE_SIZE)
+        queue.put_nowait(format_sse(
+            "snapshot", summarize_meal_counts(_stream_snapshot["date"], _stream_snapshot["choices"])
+        ))
+        _stream_subscribers.add(queue)
+        return queue
+
+@app.get("/mealcount/stream")
+async def stream_meal_counts(request: Request):
+    try:
+        queue = await subscribe_to_meal_counts()
+    except Exception as e:
+        logger.exception("Caught exception in /mealcount/stream.")
+        raise HTTPException(status_code=500, detail=f"Exception: {str(e)}")
+
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if message is None: # Closed for being too slow, or the listener went away
+                    break
+                yield message
+        finally:
+            _stream_subscribers.discard(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# --- Billing --- #
+
+MEAL_TYPES = ["Breakfast", "Lunch", "Snacks", "Dinner"]
+
+class MealRate(BaseModel):
+    meal_type: str
+    amount: Decimal
+
+class MessRecord(BaseModel):
+    student_id: int
+    date: datetime.date
+    meal_type: str
+    amount: Optional[Decimal] = None # Defaults to the meal_rates amount for meal_type
+
+def parse_billing_month(month: str):
+    # "yyyy-mm" -> (first day of month, first day of next month)
+    try:
+        start = datetime.datetime.strptime(month, "%Y-%m").date()
+        end = datetime.date(start.year + start.month // 12, start.month % 12 + 1, 1) # ValueError past 9999-12
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid month {month!r}, expected yyyy-mm.")
+    return start, end
+
+def normalize_meal_type(meal_type: str) -> str:
+    normalized = meal_type.strip().capitalize()
+    if normalized not in MEAL_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown meal type: {meal_type!r}.")
+    return normalized
+
+async def record_served_meals(conn, records):
+    # One set-based insert for the whole batch. Amounts left out are priced from
+    # meal_rates, and a meal already recorded for a student on that day is skipped.
+    # Returns the number of rows inserted.
+    result = await conn.execute(
+        """
+        INSERT INTO mess_records (student_id, date, meal_type, amount)
+        SELECT r.student_id, r.date, r.meal_type, COALESCE(r.amount, mr.amount)
+        FROM unnest($1::int[], $2::date[], $3::varchar[], $4::numeric[])
+            AS r(student_id, date, meal_type, amount)
+        LEFT JOIN meal_rates mr ON mr.meal_type = r.meal_type
+        ON CONFLICT (student_id, date, meal_type) DO NOTHING
+        """,
+        [record.student_id for record in records],
+        [record.date for record in records],
+        [record.meal_type for record in records],
+        [record.amount for record in records],
+    )
+    return int(result.split()[-1]) # "INSERT 0 <count>"
+
+# Monthly totals per student, aggregated in the database before joining student details
+MONTHLY_BILL_QUERY = """
+    WITH totals AS (
+        SELECT
+            student_id,
+            COUNT(*) FILTER (WHERE meal_type = 'Breakfast') AS breakfast,
+            COUNT(*) FILTER (WHERE meal_type = 'Lunch') AS lunch,
+            COUNT(*) FILTER (WHERE meal_type = 'Snacks') AS snacks,
+            COUNT(*) FILTER (WHERE meal_type = 'Dinner') AS dinner,
+            COUNT(*) AS meals,
+            SUM(amount) AS total
+        FROM mess_records
+        WHERE date >= $1 AND date < $2
+        GROUP BY student_id
+    )
+    SELECT s.id AS student_id, s.name, s.admission_no,
+           t.breakfast, t.lunch, t.snacks, t.dinner, t.meals, t.total
+    FROM totals t
+    JOIN students s ON s.id = t.student_id
+    ORDER BY s.name, s.id
+"""
+BILL_COLUMNS = ["student_id", "name", "admission_no", "breakfast", "lunch", "snacks", "dinner", "meals", "total"]
+
+@app.post("/billing/rates")
+async def set_meal_rates(rates: List[MealRate]):
+    meal_types = [normalize_meal_type(rate.meal_type) for rate in rates]
+    try:
+        async with queries.acquire() as conn:
+            await conn.execute(
+                """
+                INSERT INTO meal_rates (meal_type, amount)
+                SELECT * FROM unnest($1::varchar[], $2::numeric[])
+                ON CONFLICT (meal_type) DO UPDATE SET amount = EXCLUDED.amount
+                """,
+                meal_types, [rate.amount for rate in rates]
+            )
+        _priced_meal_types.update(meal_types)
+        return {"message": f"Rates updated for {', '.join(meal_types)}."}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/billing/records")
+async def create_mess_records(records: List[MessRecord]):
+    for record in records:
+        record.meal_type = normalize_meal_type(record.meal_type)
+    try:
+        async with queries.acquire() as conn:
+            inserted = await record_served_meals(conn, records)
+        return {"message": f"Recorded {inserted} meal(s).", "recorded": inserted, "skipped": len(records) - inserted}
+    except asyncpg.exceptions.NotNullViolationError:
+        raise HTTPException(status_code=400, detail="Missing amount and no rate is set for that meal type.")
+    except asyncpg.exceptions.ForeignKeyViolationError as e:
+        raise HTTPException(status_code=400, detail=f"Unknown student: {e.detail}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/billing/{month}")
+async def get_monthly_bill(month: str):
+    start, end = parse_billing_month(month)
+    try:
+        async with queries.acquire() as conn:
+            rows = await conn.fetch(MONTHLY_BILL_QUERY, start, end)
+        students = [{**dict(row), "total": str(row["total"])} for row in rows]
+        return {
+            "month": month,
+            "students": students,
+            "total": str(sum((row["total"] for row in rows), Decimal("0"))),
+        }
+    except asyncpg.exceptions.PostgresError as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+
+@app.get("/billing/{month}/export")
+async def export_monthly_bill(month: str):
+    start, end = parse_billing_month(month)
+
+    async def csv_rows():
+        # Rows are streamed from a server-side cursor instead of being built up in memory.
+        # The connection is only taken once streaming starts, and goes back to the pool when
+        # the generator finishes or is closed on a client disconnect.
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(BILL_COLUMNS)
+        async with queries.acquire() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor(MONTHLY_BILL_QUERY, start, end, prefetch=500):
+                    writer.writerow([row[column] for column in BILL_COLUMNS])
+                    if buffer.tell() > 16384:
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+        yield buffer.getvalue()
+
+    return StreamingResponse(
+        csv_rows(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="mess-bill-{month}.csv"'},
+    )
+
+# --- Ticket verification at the serving counter --- #
+
+# Tickets are checked from their signature alone. Redemptions are tracked in memory per
+# (date, meal_type) and written to mess_records in batches by a background task.
+REDEMPTION_FLUSH_SECONDS = 5
+REDEMPTION_FLUSH_BATCH_SIZE = 50
+REDEMPTION_FLUSH_MAX_ATTEMPTS = 12 # About a minute of failed flushes before a redemption is given up on
+KOLKATA_TIMEZONE = pytz.timezone("Asia/Kolkata") # Tickets are issued for the bot's (Kolkata) date
+
+_redeemed = {} # (date, meal_type) -> set of student_ids already served
+_redeemed_loading = {} # (date, meal_type) -> asyncio.Lock while loading from mess_records
+_pending_redemptions = [] # MessRecords not yet written to mess_records
+_redemption_attempts = {} # (student_id, date, meal_type) -> failed flushes so far
+_redemption_flush_requested = asyncio.Event() # Set to flush before the next timer tick
+_priced_meal_types = set() # Meal types known to have a meal_rates row
+_redemption_flusher = None
+
+class TicketScan(BaseModel):
+    token: str
+    meal_type: str
+
+async def get_redeemed_students(date, meal_type):
+    # The first scan of a meal loads what is already in mess_records, so a restart
+    # in the middle of service does not allow a second redemption.
+    key = (date, meal_type)
+    if key in _redeemed:
+        return _redeemed[key]
+    lock = _redeemed_loading.setdefault(key, asyncio.Lock())
+    async with lock:
+        if key not in _redeemed:
+            async with queries.acquire() as conn:
+                rows = await conn.fetch(
+                    "SELECT student_id FROM mess_records WHERE date = $1 AND meal_type = $2",
+                    date, meal_type
+                )
+            # Earlier days are no longer needed
+            for stale_key in [k for k in _redeemed if k[0] < date]:
+                del _redeemed[stale_key]
+            _redeemed[key] = {row["student_id"] for row in rows}
+            _redeemed[key].update(
+                record.student_id for record in _pending_redemptions
+                if record.date == date and record.meal_type == meal_type
+            )
+        _redeemed_loading.pop(key, None)
+    return _redeemed[key]
+
+def ticket_today():
+    return datetime.datetime.now(KOLKATA_TIMEZONE).date()
+
+async def has_meal_rate(meal_type):
+    # Redemptions are priced from meal_rates when they are flushed, so a meal without a
+    # rate could never be written. Only known rates are cached; a miss asks the database again.
+    if meal_type not in _priced_meal_types:
+        async with queries.acquire() as conn:
+            rows = await conn.fetch("SELECT meal_type FROM meal_rates")
+        _priced_meal_types.update(row["meal_type"] for row in rows)
+    return meal_type in _priced_meal_types
+
+def redemption_key(record):
+    return (record.student_id, record.date, record.meal_type)
+
+async def flush_redemptions():
+    if not _pending_redemptions:
+        return
+    batch = _pending_redemptions[:]
+    del _pending_redemptions[:len(batch)]
+
+    # Each meal type is written on its own, so one failing group does not hold back the others
+    groups = {}
+    for record in batch:
+        groups.setdefault(record.meal_type, []).append(record)
+    for meal_type, records in groups.items():
+        try:
+            async with queries.acquire() as conn:
+                await record_served_meals(conn, records)
+        except Exception:
+            retry = []
+            for record in records:
+                key = redemption_key(record)
+                _redemption_attempts[key] = _redemption_attempts.get(key, 0) + 1
+                if _redemption_attempts[key] < REDEMPTION_FLUSH_MAX_ATTEMPTS:
+                    retry.append(record)
+                else:
+                    del _redemption_attempts[key]
+                    logger.error("Giving up on ticket redemption %s after %d attempts.", key, REDEMPTION_FLUSH_MAX_ATTEMPTS)
+            # Kept for the next flush; record_served_meals skips rows already written
+            _pending_redemptions[:0] = retry
+            logger.exception("Error flushing %d %s ticket redemption(s); %d kept for retry.", len(records), meal_type, len(retry))
+        else:
+            for record in records:
+                _redemption_attempts.pop(redemption_key(record), None)
+
+async def run_redemption_flusher():
+    while True:
+        try:
+            await asyncio.wait_for(_redemption_flush_requested.wait(), timeout=REDEMPTION_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _redemption_flush_requested.clear()
+        await flush_redemptions()
+
+@app.on_event("startup")
+async def start_redemption_flusher():
+    global _redemption_flusher
+    _redemption_flusher = asyncio.create_task(run_redemption_flusher())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    if _redemption_flusher:
+        _redemption_flusher.cancel()
+    await flush_redemptions()
+    for record in _pending_redemptions:
+        logger.error("Ticket redemption %s was not written to mess_records before shutdown.", redemption_key(record))
+    await queries.close_pool()
+
+@app.post("/verify")
+async def verify_meal_ticket(scan: TicketScan):
+    meal_type = normalize_meal_type(scan.meal_type)
+    try:
+        ticket = verify_ticket(scan.token)
+    except InvalidTicket as e:
+        raise HTTPException(status_code=403, detail=f"Invalid ticket: {e}")
+    except MissingTicketSecret:
+        logger.error("TICKET_SECRET is not set; tickets cannot be verified.")
+        raise HTTPException(status_code=503, detail="Ticket verification is not configured (TICKET_SECRET is not set).")
+
+    today = ticket_today()
+    if ticket["date"] != today:
+        raise HTTPException(status_code=410, detail=f"Ticket is for {ticket['date']:%b %d}, not today.")
+
+    try:
+        if not await has_meal_rate(meal_type):
+            raise HTTPException(status_code=503, detail=f"No rate is set for {meal_type}; add one under /billing/rates before serving.")
+        redeemed = await get_redeemed_students(today, meal_type)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if ticket["student_id"] in redeemed:
+        raise HTTPException(status_code=409, detail=f"Ticket already used for {meal_type}.")
+
+    # Keyed by student rather than token so a re-issued ticket cannot be used twice either
+    redeemed.add(ticket["student_id"])
+    _pending_redemptions.append(MessRecord(student_id=ticket["student_id"], date=today, meal_type=meal_type))
+    if len(_pending_redemptions) >= REDEMPTION_FLUSH_BATCH_SIZE:
+        _redemption_flush_requested.set()
+
+    return {
+        "status": "ok",
+        "meal_type": meal_type,
+        "student_id": ticket["student_id"],
+        "veg_or_nonveg": ticket["veg_or_nonveg"],
+        "caffeine_choice": ticket["caffeine_choice"],
+    }
 
 if __name__ == "__main__":
     import uvicorn
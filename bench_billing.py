@@ -0,0 +1,114 @@
+import argparse
+import asyncio
+import datetime
+import os
+import statistics
+import time
+import uuid
+from decimal import Decimal
+from urllib.parse import urlsplit, urlunsplit
+
+import asyncpg
+from dotenv import load_dotenv
+from fastapi.testclient import TestClient
+
+# Benchmark for the billing endpoints in api.py. Builds a scratch database next to
+# DATABASE_URL, seeds it with a month of served meals and times /billing/{month} and
+# /billing/{month}/export. The scratch database is dropped afterwards.
+#
+#   python bench_billing.py --students 1500 --meals 90 --repeat 5
+
+load_dotenv()
+
+BENCH_MONTH = datetime.date(2026, 1, 1)
+BENCH_RATES = {"Breakfast": Decimal("30.00"), "Lunch": Decimal("60.00"), "Snacks": Decimal("20.00"), "Dinner": Decimal("60.00")}
+
+def database_url(base_url, name):
+    parts = urlsplit(base_url)
+    return urlunsplit(parts._replace(path=f"/{name}"))
+
+async def create_database(base_url, name):
+    conn = await asyncpg.connect(base_url)
+    try:
+        await conn.execute(f'CREATE DATABASE "{name}"')
+    finally:
+        await conn.close()
+
+async def drop_database(base_url, name):
+    conn = await asyncpg.connect(base_url)
+    try:
+        await conn.execute(f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)')
+    finally:
+        await conn.close()
+
+async def seed(students, meals):
+    import api # Imported after DATABASE_URL points at the scratch database
+    import migrate
+    import queries
+
+    await migrate.migrate()
+    async with queries.acquire() as conn:
+        await conn.execute(
+            """
+            INSERT INTO students (name, admission_no, tg_user_id)
+            SELECT 'Student ' || n, 'BENCH' || n, n FROM generate_series(1, $1) AS n
+            """,
+            students
+        )
+        await conn.execute(
+            "INSERT INTO meal_rates (meal_type, amount) SELECT * FROM unnest($1::varchar[], $2::numeric[])",
+            list(BENCH_RATES), list(BENCH_RATES.values())
+        )
+        student_ids = [row["id"] for row in await conn.fetch("SELECT id FROM students")]
+
+        # meals per student spread over the month's days, cycling through the meal types
+        records = [
+            api.MessRecord(
+                student_id=student_id,
+                date=BENCH_MONTH + datetime.timedelta(days=meal // len(api.MEAL_TYPES) % 28),
+                meal_type=api.MEAL_TYPES[meal % len(api.MEAL_TYPES)],
+            )
+            for student_id in student_ids
+            for meal in range(meals)
+        ]
+        start = time.perf_counter()
+        inserted = await api.record_served_meals(conn, records)
+        print(f"Recorded {inserted} meal(s) in {time.perf_counter() - start:.3f}s")
+        await conn.execute("ANALYZE mess_records")
+    await queries.close_pool()
+
+def time_endpoint(client, path, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(path)
+        response.raise_for_status()
+        timings.append(time.perf_counter() - start)
+    print(f"GET {path}: median {statistics.median(timings):.3f}s, min {min(timings):.3f}s, {len(response.content)} bytes")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the monthly billing endpoints on seeded data.")
+    parser.add_argument("--students", type=int, default=1500)
+    parser.add_argument("--meals", type=int, default=90, help="meals recorded per student in the month")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    base_url = os.getenv("DATABASE_URL")
+    if not base_url:
+        raise SystemExit("DATABASE_URL is not set.")
+    name = f"mess_bench_{uuid.uuid4().hex[:8]}"
+    asyncio.run(create_database(base_url, name))
+    try:
+        os.environ["DATABASE_URL"] = database_url(base_url, name)
+        asyncio.run(seed(args.students, args.meals))
+
+        import api
+        month = f"{BENCH_MONTH:%Y-%m}"
+        with TestClient(api.app) as client:
+            time_endpoint(client, f"/billing/{month}", args.repeat)
+            time_endpoint(client, f"/billing/{month}/export", args.repeat)
+    finally:
+        asyncio.run(drop_database(base_url, name))
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 import logging
 import datetime
 import os
-import psycopg2
+import asyncpg
 import httpx
 import pytz # Import pytz
 from dotenv import load_dotenv
@@ -21,6 +21,9 @@ import asyncio
 from functools import partial
 from PIL import Image, ImageDraw, ImageFont, ImageOps
 import io
+import qrcode
+from tickets import sign_ticket
+import queries
 
 load_dotenv()
 
@@ -55,24 +58,25 @@ logger = logging.getLogger(__name__)
 
 (POST_REGISTRATION_CHOICE,) = range(11, 12) # Adjusted range
 
-# Database connection
-def get_db_connection():
-    return psycopg2.connect(os.getenv("DATABASE_URL"))
+# Database access goes through queries.py (shared with api.py)
+
+def format_menu_text(heading: str, menu: queries.DayMenu) -> str:
+    menu_text = f"{heading}:\n"
+    menu_text += f"Breakfast: {menu.breakfast or 'N/A'}\n"
+    menu_text += f"Lunch: {menu.lunch or 'N/A'}\n"
+    menu_text += f"Snacks: {menu.snacks or 'N/A'}\n"
+    menu_text += f"Dinner: {menu.dinner or 'N/A'}"
+    return menu_text
 
 # --- Bot command handlers --- #
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM students WHERE tg_user_id = %s", (user_id,))
-    student = cur.fetchone()
-    cur.close()
-    conn.close()
+    student = await queries.get_student_by_tg_user(user_id)
 
     if student:
         await update.message.reply_text(
-            f"Hello {student[1]}! Welcome back to Hostel Bot. You are already registered."
+            f"Hello {student.name}! Welcome back to Hostel Bot. You are already registered."
         )
         return ConversationHandler.END
     else:
@@ -115,14 +119,8 @@ async def save_student_data(update: Update, context: ContextTypes.DEFAULT_TYPE)
     admission_no = context.user_data["admission_no"]
     passout_year = context.user_data["passout_year"]
 
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        cur.execute(
-            "INSERT INTO students (name, admission_no, passout_year, profile_file_id, tg_user_id) VALUES (%s, %s, %s, %s, %s)",
-            (name, admission_no, passout_year, photo_file_id, user_id),
-        )
-        conn.commit()
+        await queries.create_student(name, admission_no, passout_year, photo_file_id, user_id)
         reply_keyboard = [["Today's Food Ticket", "Tomorrow's Meal Choice"]]
         await update.message.reply_text(
             f"Thank you, {name}! You are now registered. Welcome to Hostel Bot!\n"
@@ -130,18 +128,13 @@ async def save_student_data(update: Update, context: ContextTypes.DEFAULT_TYPE)
             reply_markup=ReplyKeyboardMarkup(reply_keyboard, one_time_keyboard=True)
         )
         return POST_REGISTRATION_CHOICE
-    except psycopg2.errors.UniqueViolation:
-        conn.rollback()
+    except asyncpg.exceptions.UniqueViolationError:
         await update.message.reply_text("You are already registered. Contact support if this is an error.")
         return ConversationHandler.END # End conversation if already registered
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error saving student data: {e}")
         await update.message.reply_text("An error occurred during registration. Please try again later.")
         return ConversationHandler.END # End conversation on error
-    finally:
-        cur.close()
-        conn.close()
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.message.reply_text("Registration cancelled. Use /start to begin again.", reply_markup=ReplyKeyboardRemove())
@@ -162,45 +155,26 @@ async def handle_post_registration_choice(update: Update, context: ContextTypes.
 
 async def meal_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id FROM students WHERE tg_user_id = %s", (user_id,))
-    student_id = cur.fetchone()
-    cur.close()
-    conn.close()
-
-    if not student_id:
+    student = await queries.get_student_by_tg_user(user_id)
+
+    if not student:
         await update.message.reply_text("You need to register first using /start.")
         return ConversationHandler.END
 
-    context.user_data["student_id"] = student_id[0]
+    context.user_data["student_id"] = student.id
     tomorrow_date = datetime.date.today() + datetime.timedelta(days=1)
     tomorrow_weekday = tomorrow_date.strftime("%A")
-    
-    conn.close() # Close connection used for student_id, open new for menu query
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
     try:
-        cur.execute("SELECT breakfast, lunch, snacks, dinner FROM menus WHERE weekday = %s", (tomorrow_weekday,))
-        menu_data = cur.fetchone()
+        menu_data = await queries.get_menu(tomorrow_weekday)
 
         if menu_data:
-            menu_text = f"Tomorrow's Menu ({tomorrow_weekday}):\n"
-            menu_text += f"Breakfast: {menu_data[0] or 'N/A'}\n"
-            menu_text += f"Lunch: {menu_data[1] or 'N/A'}\n"
-            menu_text += f"Snacks: {menu_data[2] or 'N/A'}\n"
-            menu_text += f"Dinner: {menu_data[3] or 'N/A'}"
-            await update.message.reply_text(menu_text)
+            await update.message.reply_text(format_menu_text(f"Tomorrow's Menu ({tomorrow_weekday})", menu_data))
         else:
             await update.message.reply_text(f"No menu available for tomorrow ({tomorrow_weekday}).")
     except Exception as e:
         logger.error(f"Error fetching tomorrow's menu from DB: {e}")
         await update.message.reply_text("Could not fetch tomorrow's menu.")
-    finally:
-        cur.close()
-        conn.close()
 
     reply_keyboard = [["Veg", "Non-Veg"]]
     await update.message.reply_text(
@@ -240,45 +214,24 @@ async def save_meal_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     # Calculate tomorrow's date based on the timezone-aware today
     tomorrow_date = today_date_time.date() + datetime.timedelta(days=1)
 
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        cur.execute(
-            """
-            INSERT INTO meal_choices (student_id, date, veg_or_nonveg, caffeine_choice)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (student_id, date) DO UPDATE SET
-                veg_or_nonveg = EXCLUDED.veg_or_nonveg,
-                caffeine_choice = EXCLUDED.caffeine_choice
-            """,
-            (student_id, tomorrow_date, veg_or_nonveg, caffeine_choice)
-        )
-        conn.commit()
+        await queries.save_meal_choice(student_id, tomorrow_date, veg_or_nonveg, caffeine_choice)
         await update.message.reply_text("Your meal choice has been saved!", reply_markup=ReplyKeyboardRemove())
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error saving meal choice: {e}")
         await update.message.reply_text("An error occurred. Try again later.", reply_markup=ReplyKeyboardRemove())
-    finally:
-        cur.close()
-        conn.close()
     return ConversationHandler.END
 
 # --- Weekly choice handlers --- #
 async def weekly_choice_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT id FROM students WHERE tg_user_id = %s", (user_id,))
-    student_id = cur.fetchone()
-    cur.close()
-    conn.close()
-
-    if not student_id:
+    student = await queries.get_student_by_tg_user(user_id)
+
+    if not student:
         await update.message.reply_text("You need to register first using /start.")
         return ConversationHandler.END
 
-    context.user_data["student_id"] = student_id[0]
+    context.user_data["student_id"] = student.id
     reply_keyboard = [
         ["Monday", "Tuesday", "Wednesday"],
         ["Thursday", "Friday", "Saturday"],
@@ -298,27 +251,16 @@ async def weekly_choice_veg_nonveg(update: Update, context: ContextTypes.DEFAULT
         return WEEKLY_CHOICE_DAY
     context.user_data["weekly_choice_day"] = day
 
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("SELECT breakfast, lunch, snacks, dinner FROM menus WHERE weekday = %s", (day,))
-        menu_data = cur.fetchone()
+        menu_data = await queries.get_menu(day)
 
         if menu_data:
-            menu_text = f"Menu for {day}:\n"
-            menu_text += f"Breakfast: {menu_data[0] or 'N/A'}\n"
-            menu_text += f"Lunch: {menu_data[1] or 'N/A'}\n"
-            menu_text += f"Snacks: {menu_data[2] or 'N/A'}\n"
-            menu_text += f"Dinner: {menu_data[3] or 'N/A'}"
-            await update.message.reply_text(menu_text)
+            await update.message.reply_text(format_menu_text(f"Menu for {day}", menu_data))
         else:
             await update.message.reply_text(f"No menu available for {day}.")
     except Exception as e:
         logger.error(f"Error fetching menu for {day} from DB: {e}")
         await update.message.reply_text("Could not fetch menu for the selected day.")
-    finally:
-        cur.close()
-        conn.close()
 
     reply_keyboard = [["Veg", "Non-Veg"]]
     await update.message.reply_text(
@@ -351,50 +293,19 @@ async def save_weekly_choice(update: Update, context: ContextTypes.DEFAULT_TYPE)
     day = context.user_data["weekly_choice_day"]
     veg_or_nonveg = context.user_data["weekly_choice_veg_nonveg"]
 
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        cur.execute(
-            """
-            INSERT INTO weekly_choices (student_id, weekday, veg_or_nonveg, caffeine_choice)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (student_id, weekday) DO UPDATE SET
-                veg_or_nonveg = EXCLUDED.veg_or_nonveg,
-                caffeine_choice = EXCLUDED.caffeine_choice
-            """,
-            (student_id, day, veg_or_nonveg, caffeine_choice)
-        )
-        conn.commit()
+        await queries.save_weekly_choice(student_id, day, veg_or_nonveg, caffeine_choice)
         await update.message.reply_text(f"Your weekly preference for {day} has been saved!", reply_markup=ReplyKeyboardRemove())
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error saving weekly choice: {e}")
         await update.message.reply_text("An error occurred. Try again later.", reply_markup=ReplyKeyboardRemove())
-    finally:
-        cur.close()
-        conn.close()
     return ConversationHandler.END
 
 # --- Ticket handler --- #
 async def ticket(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        # Fetch student details
-        cur.execute(
-            "SELECT id, name, profile_file_id FROM students WHERE tg_user_id = %s",
-            (user_id,)
-        )
-        student_data = cur.fetchone()
-
-        if not student_data:
-            await update.message.reply_text("You need to register first using /start.")
-            return ConversationHandler.END
-
-        student_id, student_name, profile_file_id = student_data
 
+    try:
         # Determine today's meal choice based on hierarchy: meal_choices > weekly_choices > default non-veg
         # Define the timezone for Asia/Calcutta
         kolkata_timezone = pytz.timezone('Asia/Kolkata')
@@ -402,40 +313,35 @@ async def ticket(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         # Get the current time in the specified timezone
         today_date_time = datetime.datetime.now(kolkata_timezone)
         
-        # Extract today's date and weekday
+        # Extract today's date
         today_date = today_date_time.date()
-        today_weekday = today_date.strftime("%A")
 
-        today_meal_choice = None
-        
-        # 1. Check meal_choices table for today's explicit choice
-        cur.execute(
-            "SELECT veg_or_nonveg, caffeine_choice FROM meal_choices WHERE student_id = %s AND date = %s",
-            (student_id, today_date)
+        # Fetch student details together with today's resolved choice in one query
+        student_with_choice = await queries.get_student_with_choice(user_id, today_date)
+
+        if not student_with_choice:
+            await update.message.reply_text("You need to register first using /start.")
+            return ConversationHandler.END
+
+        student, today_meal_choice = student_with_choice
+        veg_nonveg = f"{today_meal_choice.veg_or_nonveg} (Default)" if today_meal_choice.is_default else today_meal_choice.veg_or_nonveg
+
+        # Signed token checked by staff at the counter via /verify in api.py
+        ticket_token = sign_ticket(
+            student.id,
+            today_date,
+            today_meal_choice.veg_or_nonveg,
+            today_meal_choice.caffeine_choice
         )
-        today_meal_choice = cur.fetchone()
-
-        if not today_meal_choice:
-            # 2. Else, check weekly_choices for today's preference
-            cur.execute(
-                "SELECT veg_or_nonveg, caffeine_choice FROM weekly_choices WHERE student_id = %s AND weekday = %s",
-                (student_id, today_weekday)
-            )
-            today_meal_choice = cur.fetchone()
-
-        veg_nonveg = "Non-Veg (Default)"
-        caffeine = "None"
-        if today_meal_choice:
-            veg_nonveg = today_meal_choice[0] if today_meal_choice[0] is not None else "Non-Veg (Default)"
-            caffeine = today_meal_choice[1] if today_meal_choice[1] is not None else "None"
 
         # Generate ticket image
         ticket_image = await generate_ticket_image(
-            student_name,
+            student.name,
             today_date.strftime("%b %d"), # Use timezone-aware today_date for formatting
             veg_nonveg,
-            caffeine,
-            profile_file_id,
+            today_meal_choice.caffeine_choice,
+            student.profile_file_id,
+            ticket_token,
             context
         )
         
@@ -445,9 +351,6 @@ async def ticket(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     except Exception as e:
         logger.error(f"Error generating or sending ticket: {e}")
         await update.message.reply_text("An error occurred while generating your food ticket. Please try again later.")
-    finally:
-        cur.close()
-        conn.close()
     return ConversationHandler.END
 
 async def generate_ticket_image(
@@ -456,6 +359,7 @@ async def generate_ticket_image(
     veg_nonveg: str,
     caffeine: str,
     profile_file_id: str,
+    ticket_token: str,
     context: ContextTypes.DEFAULT_TYPE
 ) -> bytes:
     # Get profile photo
@@ -465,7 +369,7 @@ async def generate_ticket_image(
 
     # Create ticket image
     # Increase image size to make default font appear larger
-    img_width, img_height = 2560, 2000 # Ensure square for better vertical centering
+    img_width, img_height = 2560, 2700 # Extra height below the text for the QR code
     img = Image.new("RGB", (img_width, img_height), color="white")
     d = ImageDraw.Draw(img)
 
@@ -511,6 +415,14 @@ async def generate_ticket_image(
     d.text((text_x_start, 1200 + text_height_veg_nonveg + 100), caffeine, fill=(0, 0, 0), font=caffeine_font) # Adjusted Y position and increased padding
     # Removed the "🎫 Food Ticket" text
 
+    # QR code with the signed ticket token, scanned at the serving counter
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, border=2)
+    qr.add_data(ticket_token)
+    qr.make(fit=True)
+    qr_img = qr.make_image(fill_color="black", back_color="white").get_image().convert("RGB")
+    qr_img = qr_img.resize((650, 650), Image.Resampling.NEAREST) # NEAREST keeps the modules sharp
+    img.paste(qr_img, (text_x_start, 1950))
+
     # Convert to bytes
     byte_arr = io.BytesIO()
     img.save(byte_arr, format="PNG")
@@ -536,27 +448,16 @@ async def fetch_and_display_menu(update: Update, context: ContextTypes.DEFAULT_T
         await update.message.reply_text("Invalid day. Please choose a day from the keyboard.")
         return MENU_CHOICE_DAY
 
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("SELECT breakfast, lunch, snacks, dinner FROM menus WHERE weekday = %s", (day,))
-        menu_data = cur.fetchone()
+        menu_data = await queries.get_menu(day)
 
         if menu_data:
-            menu_text = f"Menu for {day}:\n"
-            menu_text += f"Breakfast: {menu_data[0] or 'N/A'}\n"
-            menu_text += f"Lunch: {menu_data[1] or 'N/A'}\n"
-            menu_text += f"Snacks: {menu_data[2] or 'N/A'}\n"
-            menu_text += f"Dinner: {menu_data[3] or 'N/A'}"
-            await update.message.reply_text(menu_text, reply_markup=ReplyKeyboardRemove())
+            await update.message.reply_text(format_menu_text(f"Menu for {day}", menu_data), reply_markup=ReplyKeyboardRemove())
         else:
             await update.message.reply_text(f"No menu available for {day}.", reply_markup=ReplyKeyboardRemove())
     except Exception as e:
         logger.error(f"Error fetching menu for {day} from DB: {e}")
         await update.message.reply_text("Could not fetch menu for the selected day.", reply_markup=ReplyKeyboardRemove())
-    finally:
-        cur.close()
-        conn.close()
     return ConversationHandler.END
 
 # Initialize FastAPI app and Telegram bot
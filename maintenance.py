@@ -0,0 +1,48 @@
+import argparse
+import asyncio
+import datetime
+
+from dotenv import load_dotenv
+
+import queries
+
+# Periodic job for the monthly meal_choices partitions (see migrations/0004_partition_meal_choices.sql):
+# creates partitions ahead of time and archives the ones older than the retention window.
+#
+#   python maintenance.py --months-ahead 3 --keep-months 6
+
+load_dotenv()
+
+def add_months(date: datetime.date, months: int) -> datetime.date:
+    month_index = date.year * 12 + date.month - 1 + months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+async def maintain_meal_choice_partitions(months_ahead: int, keep_months: int, today=None):
+    this_month = (today or datetime.date.today()).replace(day=1)
+    conn = await queries.connect()
+    try:
+        # Months that spilled into the default partition get their own partition too,
+        # so they can be archived like any other month
+        spilled = await conn.fetch("SELECT DISTINCT date_trunc('month', date)::date AS month FROM meal_choices_default")
+        months = sorted(
+            {row["month"] for row in spilled} |
+            {add_months(this_month, offset) for offset in range(months_ahead + 1)}
+        )
+        for month in months:
+            partition = await conn.fetchval("SELECT create_meal_choices_partition($1)", month)
+            print(f"Partition ready: {partition}")
+        archived = await conn.fetch(
+            "SELECT archive_meal_choices_partitions($1) AS partition",
+            add_months(this_month, -keep_months)
+        )
+        for row in archived:
+            print(f"Archived partition: archive.{row['partition']}")
+    finally:
+        await conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create upcoming and archive old meal_choices partitions.")
+    parser.add_argument("--months-ahead", type=int, default=3, help="future months to create partitions for")
+    parser.add_argument("--keep-months", type=int, default=6, help="full past months to keep attached")
+    args = parser.parse_args()
+    asyncio.run(maintain_meal_choice_partitions(args.months_ahead, args.keep_months))
@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+import queries
+
+# Applies the numbered SQL files in migrations/ that have not been recorded in
+# schema_migrations yet, each one in its own transaction.
+#
+#   python migrate.py                          # apply pending migrations
+#   python migrate.py --baseline 0001_initial  # mark a database built by hand as already at 0001
+
+load_dotenv()
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+MIGRATION_LOCK_ID = 7261001 # pg_advisory_lock key so two deploys cannot migrate at once
+
+def migration_files():
+    return sorted(MIGRATIONS_DIR.glob("*.sql"))
+
+async def migrate(baseline=None):
+    conn = await queries.connect()
+    try:
+        await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version VARCHAR(255) PRIMARY KEY,
+                applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        applied = {row["version"] for row in await conn.fetch("SELECT version FROM schema_migrations")}
+        versions = [path.stem for path in migration_files()]
+        if baseline is not None and baseline not in versions:
+            raise SystemExit(f"Unknown migration {baseline!r}; expected one of {', '.join(versions)}.")
+
+        for path in migration_files():
+            version = path.stem
+            if version in applied:
+                continue
+            async with conn.transaction():
+                if baseline is not None and version <= baseline:
+                    print(f"Marking {version} as applied")
+                else:
+                    print(f"Applying {version}")
+                    await conn.execute(path.read_text())
+                await conn.execute("INSERT INTO schema_migrations (version) VALUES ($1)", version)
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+        await conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply database migrations.")
+    parser.add_argument(
+        "--baseline",
+        help="record migrations up to and including this version as applied without running them",
+    )
+    args = parser.parse_args()
+    asyncio.run(migrate(baseline=args.baseline))
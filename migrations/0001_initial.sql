@@ -41,4 +41,4 @@ CREATE TABLE menus (
     lunch TEXT,
     snacks TEXT,
     dinner TEXT
-);
\ No newline at end of file
+);
@@ -0,0 +1,35 @@
+-- Per-table version counters used by the admin API to build ETags.
+-- Bumped once per write statement by bump_table_version().
+CREATE TABLE table_versions (
+    table_name VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO table_versions (table_name) VALUES
+    ('students'),
+    ('menus'),
+    ('meal_choices'),
+    ('weekly_choices');
+
+CREATE FUNCTION bump_table_version() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE table_versions SET version = version + 1 WHERE table_name = TG_TABLE_NAME;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER students_bump_version
+    AFTER INSERT OR UPDATE OR DELETE ON students
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+CREATE TRIGGER menus_bump_version
+    AFTER INSERT OR UPDATE OR DELETE ON menus
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+CREATE TRIGGER meal_choices_bump_version
+    AFTER INSERT OR UPDATE OR DELETE ON meal_choices
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+CREATE TRIGGER weekly_choices_bump_version
+    AFTER INSERT OR UPDATE OR DELETE ON weekly_choices
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
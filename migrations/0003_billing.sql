@@ -0,0 +1,9 @@
+-- Billing: price per meal type, and indexes for monthly aggregation over mess_records
+CREATE TABLE meal_rates (
+    meal_type VARCHAR(50) PRIMARY KEY,
+    amount DECIMAL(10, 2) NOT NULL
+);
+
+-- A student is billed at most once per meal per day
+CREATE UNIQUE INDEX mess_records_student_date_meal_idx ON mess_records (student_id, date, meal_type);
+CREATE INDEX mess_records_date_idx ON mess_records (date);
@@ -0,0 +1,99 @@
+-- meal_choices becomes a table range-partitioned by month on date, so queries for one day
+-- only touch that month's partition and old months can be detached and archived
+-- (see maintenance.py). Rows outside every monthly partition land in meal_choices_default.
+
+-- Keep the id sequence alive while the old table is dropped
+ALTER SEQUENCE meal_choices_id_seq OWNED BY NONE;
+
+ALTER TABLE meal_choices RENAME TO meal_choices_unpartitioned;
+ALTER TABLE meal_choices_unpartitioned RENAME CONSTRAINT meal_choices_pkey TO meal_choices_unpartitioned_pkey;
+ALTER TABLE meal_choices_unpartitioned RENAME CONSTRAINT meal_choices_student_id_date_key TO meal_choices_unpartitioned_student_id_date_key;
+
+-- Unique constraints on a partitioned table must include the partition key, hence (id, date)
+CREATE TABLE meal_choices (
+    id INT NOT NULL DEFAULT nextval('meal_choices_id_seq'),
+    student_id INT NOT NULL,
+    date DATE NOT NULL,
+    veg_or_nonveg VARCHAR(10) NOT NULL,
+    caffeine_choice VARCHAR(10) NOT NULL,
+    CONSTRAINT meal_choices_pkey PRIMARY KEY (id, date),
+    CONSTRAINT meal_choices_student_id_fkey FOREIGN KEY (student_id) REFERENCES students(id),
+    CONSTRAINT meal_choices_student_id_date_key UNIQUE (student_id, date)
+) PARTITION BY RANGE (date);
+
+ALTER SEQUENCE meal_choices_id_seq OWNED BY meal_choices.id;
+
+CREATE TABLE meal_choices_default PARTITION OF meal_choices DEFAULT;
+
+-- Date-leading index for the per-day queries (meal counts, tickets)
+CREATE INDEX meal_choices_date_idx ON meal_choices (date, student_id);
+
+-- Creates the partition holding p_month (any day in it) if it does not exist yet.
+-- Rows for that month already sitting in the default partition are moved into it.
+CREATE FUNCTION create_meal_choices_partition(p_month DATE) RETURNS TEXT AS $$
+DECLARE
+    start_date DATE := date_trunc('month', p_month);
+    end_date DATE := date_trunc('month', p_month) + INTERVAL '1 month';
+    partition_name TEXT := 'meal_choices_' || to_char(p_month, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE meal_choices INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM meal_choices_default WHERE date >= %L AND date < %L RETURNING *)
+         INSERT INTO %I SELECT * FROM moved',
+        start_date, end_date, partition_name
+    );
+    EXECUTE format(
+        'ALTER TABLE meal_choices ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, start_date, end_date
+    );
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Detaches every monthly partition that ends on or before p_before and moves it to the
+-- archive schema, where it stays queryable but is no longer scanned through meal_choices.
+CREATE SCHEMA IF NOT EXISTS archive;
+
+CREATE FUNCTION archive_meal_choices_partitions(p_before DATE) RETURNS SETOF TEXT AS $$
+DECLARE
+    partition_name TEXT;
+BEGIN
+    FOR partition_name IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'meal_choices'::regclass
+          AND c.relname ~ '^meal_choices_[0-9]{4}_[0-9]{2}$'
+          AND to_date(right(c.relname, 7), 'YYYY_MM') + INTERVAL '1 month' <= p_before
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format('ALTER TABLE meal_choices DETACH PARTITION %I', partition_name);
+        EXECUTE format('ALTER TABLE %I SET SCHEMA archive', partition_name);
+        RETURN NEXT partition_name;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partitions for every month with existing choices, through three months ahead
+SELECT create_meal_choices_partition(month::date)
+FROM generate_series(
+    date_trunc('month', COALESCE((SELECT MIN(date) FROM meal_choices_unpartitioned), CURRENT_DATE)),
+    date_trunc('month', GREATEST(COALESCE((SELECT MAX(date) FROM meal_choices_unpartitioned), CURRENT_DATE), CURRENT_DATE)) + INTERVAL '3 months',
+    INTERVAL '1 month'
+) AS month;
+
+INSERT INTO meal_choices (id, student_id, date, veg_or_nonveg, caffeine_choice)
+SELECT id, student_id, date, veg_or_nonveg, caffeine_choice FROM meal_choices_unpartitioned;
+
+DROP TABLE meal_choices_unpartitioned;
+
+-- The version trigger from 0002 went with the old table
+CREATE TRIGGER meal_choices_bump_version
+    AFTER INSERT OR UPDATE OR DELETE ON meal_choices
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version();
+
+-- Weekday-leading index for the weekly fallback lookups
+CREATE INDEX weekly_choices_weekday_idx ON weekly_choices (weekday, student_id);
@@ -0,0 +1,18 @@
+-- Effective meal choice of a student for a date, in one place for every caller:
+-- meal_choices for that date > weekly_choices for its weekday > default Non-Veg / no caffeine.
+-- is_default is true when neither table set veg/non-veg.
+--
+-- A single-SELECT, STABLE SQL function, so Postgres inlines it into the calling query.
+-- Joined LATERAL against students, or against unnest()ed arrays of student ids and dates,
+-- it resolves any batch in one round trip.
+CREATE FUNCTION effective_choice(p_student_id INT, p_date DATE)
+RETURNS TABLE (veg_or_nonveg VARCHAR, caffeine_choice VARCHAR, is_default BOOLEAN)
+LANGUAGE sql STABLE AS $$
+    SELECT
+        COALESCE(mc.veg_or_nonveg, wc.veg_or_nonveg, 'Non-Veg')::VARCHAR,
+        COALESCE(mc.caffeine_choice, wc.caffeine_choice, 'None')::VARCHAR,
+        mc.veg_or_nonveg IS NULL AND wc.veg_or_nonveg IS NULL
+    FROM (SELECT p_student_id AS student_id, p_date AS date) AS q
+    LEFT JOIN meal_choices mc ON mc.student_id = q.student_id AND mc.date = q.date
+    LEFT JOIN weekly_choices wc ON wc.student_id = q.student_id AND wc.weekday = to_char(q.date, 'FMDay')
+$$;
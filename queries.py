@@ -0,0 +1,322 @@
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import asyncpg
+
+# Shared data access for bot.py and api.py.
+# Every statement below is prepared once per pooled connection: asyncpg keeps a per-connection
+# cache of prepared statements keyed by SQL text, so after a statement's first run on a
+# connection only the bind/execute round trip remains. Rows come back as the dataclasses
+# defined here rather than positional tuples.
+
+# Channel the admin API listens on to push live meal counts (see /mealcount/stream in api.py)
+MEALCOUNT_CHANNEL = "meal_choice_updates"
+
+# --- Typed records --- #
+
+@dataclass(frozen=True)
+class Student:
+    id: int
+    name: str
+    admission_no: str
+    passout_year: Optional[int]
+    profile_file_id: Optional[str]
+    tg_user_id: int
+
+@dataclass(frozen=True)
+class DayMenu:
+    weekday: str
+    breakfast: Optional[str]
+    lunch: Optional[str]
+    snacks: Optional[str]
+    dinner: Optional[str]
+
+@dataclass(frozen=True)
+class MealChoice:
+    veg_or_nonveg: str
+    caffeine_choice: str
+    is_default: bool = False # True when neither a daily nor a weekly choice set veg/non-veg
+
+# --- Statements --- #
+
+STATEMENTS = {
+    "student_by_tg_user": """
+        SELECT id, name, admission_no, passout_year, profile_file_id, tg_user_id
+        FROM students WHERE tg_user_id = $1
+    """,
+    "student_by_id": """
+        SELECT id, name, admission_no, passout_year, profile_file_id, tg_user_id
+        FROM students WHERE id = $1
+    """,
+    "all_students": """
+        SELECT id, name, admission_no, passout_year, profile_file_id, tg_user_id
+        FROM students
+    """,
+    "insert_student": """
+        INSERT INTO students (name, admission_no, passout_year, profile_file_id, tg_user_id)
+        VALUES ($1, $2, $3, $4, $5)
+        RETURNING id, name, admission_no, passout_year, profile_file_id, tg_user_id
+    """,
+    "menu_by_weekday": """
+        SELECT weekday, breakfast, lunch, snacks, dinner FROM menus WHERE weekday = $1
+    """,
+    "all_menus": """
+        SELECT weekday, breakfast, lunch, snacks, dinner FROM menus
+    """,
+    "upsert_menus": """
+        INSERT INTO menus (weekday, breakfast, lunch, snacks, dinner)
+        SELECT * FROM unnest($1::varchar[], $2::text[], $3::text[], $4::text[], $5::text[])
+        ON CONFLICT (weekday) DO UPDATE SET
+            breakfast = EXCLUDED.breakfast,
+            lunch = EXCLUDED.lunch,
+            snacks = EXCLUDED.snacks,
+            dinner = EXCLUDED.dinner
+    """,
+    # Same as upsert_menus, but meals left NULL keep whatever the existing menu has
+    "merge_menus": """
+        INSERT INTO menus (weekday, breakfast, lunch, snacks, dinner)
+        SELECT * FROM unnest($1::varchar[], $2::text[], $3::text[], $4::text[], $5::text[])
+        ON CONFLICT (weekday) DO UPDATE SET
+            breakfast = COALESCE(EXCLUDED.breakfast, menus.breakfast),
+            lunch = COALESCE(EXCLUDED.lunch, menus.lunch),
+            snacks = COALESCE(EXCLUDED.snacks, menus.snacks),
+            dinner = COALESCE(EXCLUDED.dinner, menus.dinner)
+    """,
+    "upsert_meal_choice": """
+        INSERT INTO meal_choices (student_id, date, veg_or_nonveg, caffeine_choice)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (student_id, date) DO UPDATE SET
+            veg_or_nonveg = EXCLUDED.veg_or_nonveg,
+            caffeine_choice = EXCLUDED.caffeine_choice
+    """,
+    "upsert_weekly_choice": """
+        INSERT INTO weekly_choices (student_id, weekday, veg_or_nonveg, caffeine_choice)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (student_id, weekday) DO UPDATE SET
+            veg_or_nonveg = EXCLUDED.veg_or_nonveg,
+            caffeine_choice = EXCLUDED.caffeine_choice
+    """,
+    # The choice hierarchy lives in the effective_choice() SQL function
+    # (migrations/0005_effective_choice.sql), which Postgres inlines into each of these
+    "effective_choices": """
+        SELECT q.student_id, q.date, c.veg_or_nonveg, c.caffeine_choice, c.is_default
+        FROM unnest($1::int[], $2::date[]) AS q(student_id, date)
+        CROSS JOIN LATERAL effective_choice(q.student_id, q.date) AS c
+    """,
+    "student_with_choice_by_tg_user": """
+        SELECT s.id, s.name, s.admission_no, s.passout_year, s.profile_file_id, s.tg_user_id,
+               c.veg_or_nonveg, c.caffeine_choice, c.is_default
+        FROM students s
+        CROSS JOIN LATERAL effective_choice(s.id, $2) AS c
+        WHERE s.tg_user_id = $1
+    """,
+    "students_with_choices": """
+        SELECT s.id, s.name, s.admission_no, s.passout_year, s.profile_file_id, s.tg_user_id,
+               c.veg_or_nonveg, c.caffeine_choice, c.is_default
+        FROM students s
+        CROSS JOIN LATERAL effective_choice(s.id, $1) AS c
+    """,
+    "notify_choice_change": """
+        SELECT pg_notify($1, $2)
+    """,
+    "table_versions": """
+        SELECT table_name, version FROM table_versions WHERE table_name = ANY($1::text[])
+    """,
+}
+
+# --- Connections --- #
+
+# Room for every statement in STATEMENTS plus ad-hoc queries run on the same connections
+STATEMENT_CACHE_SIZE = 256
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+async def get_pool():
+    # Created lazily so it belongs to the event loop that first uses it
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await asyncpg.create_pool(
+                os.getenv("DATABASE_URL"),
+                min_size=1,
+                max_size=int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+                statement_cache_size=STATEMENT_CACHE_SIZE,
+            )
+    return _pool
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+@contextlib.asynccontextmanager
+async def acquire():
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        yield conn
+
+async def connect():
+    # A dedicated connection outside the pool (e.g. for LISTEN)
+    return await asyncpg.connect(os.getenv("DATABASE_URL"), statement_cache_size=STATEMENT_CACHE_SIZE)
+
+@contextlib.asynccontextmanager
+async def _connection(conn):
+    if conn is not None:
+        yield conn
+    else:
+        async with acquire() as acquired:
+            yield acquired
+
+# --- Timing hooks --- #
+
+_timing_hooks: List[Callable[[str, float], None]] = []
+
+def add_timing_hook(hook: Callable[[str, float], None]) -> None:
+    # hook(statement_name, elapsed_seconds) is called after every statement, even failed ones
+    _timing_hooks.append(hook)
+
+def remove_timing_hook(hook: Callable[[str, float], None]) -> None:
+    _timing_hooks.remove(hook)
+
+async def _run(conn, name, method, *args):
+    start = time.perf_counter()
+    try:
+        return await getattr(conn, method)(STATEMENTS[name], *args)
+    finally:
+        elapsed = time.perf_counter() - start
+        for hook in _timing_hooks:
+            hook(name, elapsed)
+
+# --- Students --- #
+
+async def get_student_by_tg_user(tg_user_id: int, conn=None) -> Optional[Student]:
+    async with _connection(conn) as conn:
+        row = await _run(conn, "student_by_tg_user", "fetchrow", tg_user_id)
+    return Student(**row) if row else None
+
+async def get_student(student_id: int, conn=None) -> Optional[Student]:
+    async with _connection(conn) as conn:
+        row = await _run(conn, "student_by_id", "fetchrow", student_id)
+    return Student(**row) if row else None
+
+async def list_students(conn=None) -> List[Student]:
+    async with _connection(conn) as conn:
+        rows = await _run(conn, "all_students", "fetch")
+    return [Student(**row) for row in rows]
+
+async def create_student(
+    name: str,
+    admission_no: str,
+    passout_year: Optional[int],
+    profile_file_id: Optional[str],
+    tg_user_id: int,
+    conn=None
+) -> Student:
+    # Raises asyncpg.exceptions.UniqueViolationError if the student is already registered
+    async with _connection(conn) as conn:
+        async with conn.transaction():
+            row = await _run(conn, "insert_student", "fetchrow", name, admission_no, passout_year, profile_file_id, tg_user_id)
+            # New students count as default choices from now on, so live counts need to hear about them
+            change = {"table": "students", "student_id": row["id"]}
+            await _run(conn, "notify_choice_change", "execute", MEALCOUNT_CHANNEL, json.dumps(change))
+    return Student(**row)
+
+# --- Menus --- #
+
+async def get_menu(weekday: str, conn=None) -> Optional[DayMenu]:
+    async with _connection(conn) as conn:
+        row = await _run(conn, "menu_by_weekday", "fetchrow", weekday)
+    return DayMenu(**row) if row else None
+
+async def list_menus(conn=None) -> List[DayMenu]:
+    async with _connection(conn) as conn:
+        rows = await _run(conn, "all_menus", "fetch")
+    return [DayMenu(**row) for row in rows]
+
+async def upsert_menus(menus: List[DayMenu], keep_missing: bool = False, conn=None) -> None:
+    # One multi-row upsert, so a whole week is written atomically.
+    # With keep_missing, meals that are None leave the stored value alone instead of clearing it.
+    async with _connection(conn) as conn:
+        await _run(
+            conn, "merge_menus" if keep_missing else "upsert_menus", "execute",
+            [menu.weekday for menu in menus],
+            [menu.breakfast for menu in menus],
+            [menu.lunch for menu in menus],
+            [menu.snacks for menu in menus],
+            [menu.dinner for menu in menus],
+        )
+
+# --- Choices --- #
+
+async def save_meal_choice(student_id: int, date: datetime.date, veg_or_nonveg: str, caffeine_choice: str, conn=None) -> None:
+    async with _connection(conn) as conn:
+        async with conn.transaction():
+            await _run(conn, "upsert_meal_choice", "execute", student_id, date, veg_or_nonveg, caffeine_choice)
+            # Delivered by Postgres only when the transaction commits
+            change = {"table": "meal_choices", "student_id": student_id, "date": date.isoformat()}
+            await _run(conn, "notify_choice_change", "execute", MEALCOUNT_CHANNEL, json.dumps(change))
+
+async def save_weekly_choice(student_id: int, weekday: str, veg_or_nonveg: str, caffeine_choice: str, conn=None) -> None:
+    async with _connection(conn) as conn:
+        async with conn.transaction():
+            await _run(conn, "upsert_weekly_choice", "execute", student_id, weekday, veg_or_nonveg, caffeine_choice)
+            change = {"table": "weekly_choices", "student_id": student_id, "weekday": weekday}
+            await _run(conn, "notify_choice_change", "execute", MEALCOUNT_CHANNEL, json.dumps(change))
+
+def _student_with_choice(row) -> Tuple[Student, MealChoice]:
+    student = Student(
+        row["id"], row["name"], row["admission_no"], row["passout_year"], row["profile_file_id"], row["tg_user_id"]
+    )
+    return student, MealChoice(row["veg_or_nonveg"], row["caffeine_choice"], row["is_default"])
+
+async def resolve_choices(
+    pairs: Iterable[Tuple[int, datetime.date]],
+    conn=None
+) -> Dict[Tuple[int, datetime.date], MealChoice]:
+    # (student_id, date) -> effective choice, for any batch in one round trip
+    pairs = list(pairs)
+    async with _connection(conn) as conn:
+        rows = await _run(
+            conn, "effective_choices", "fetch",
+            [student_id for student_id, _ in pairs],
+            [date for _, date in pairs],
+        )
+    return {
+        (row["student_id"], row["date"]): MealChoice(row["veg_or_nonveg"], row["caffeine_choice"], row["is_default"])
+        for row in rows
+    }
+
+async def resolve_choice(student_id: int, date: datetime.date, conn=None) -> MealChoice:
+    # Hierarchy: meal_choices for the date > weekly_choices for its weekday > default Non-Veg
+    choices = await resolve_choices([(student_id, date)], conn=conn)
+    return choices[(student_id, date)]
+
+async def get_student_with_choice(
+    tg_user_id: int,
+    date: datetime.date,
+    conn=None
+) -> Optional[Tuple[Student, MealChoice]]:
+    # Student lookup and choice resolution in a single statement (used for tickets)
+    async with _connection(conn) as conn:
+        row = await _run(conn, "student_with_choice_by_tg_user", "fetchrow", tg_user_id, date)
+    return _student_with_choice(row) if row else None
+
+async def list_students_with_choices(date: datetime.date, conn=None) -> List[Tuple[Student, MealChoice]]:
+    async with _connection(conn) as conn:
+        rows = await _run(conn, "students_with_choices", "fetch", date)
+    return [_student_with_choice(row) for row in rows]
+
+# --- Cache versions --- #
+
+async def get_table_versions(table_names: List[str], conn=None) -> dict:
+    async with _connection(conn) as conn:
+        rows = await _run(conn, "table_versions", "fetch", table_names)
+    return {row["table_name"]: row["version"] for row in rows}
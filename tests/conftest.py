@@ -0,0 +1,75 @@
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit
+
+import asyncpg
+import pytest
+
+# api.py, queries.py etc. live at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import migrate
+import queries
+
+# Tables emptied before every database-backed test
+TABLES = ["mess_records", "meal_rates", "meal_choices", "weekly_choices", "menus", "students"]
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+async def _execute(url, sql):
+    conn = await asyncpg.connect(url)
+    try:
+        await conn.execute(sql)
+    finally:
+        await conn.close()
+
+@pytest.fixture(scope="session")
+def database_url():
+    # A scratch database next to DATABASE_URL, built from migrations/ and dropped afterwards
+    base_url = os.getenv("DATABASE_URL")
+    if not base_url:
+        pytest.skip("DATABASE_URL is not set; skipping tests that need Postgres.")
+    name = f"mess_test_{uuid.uuid4().hex[:8]}"
+    url = urlunsplit(urlsplit(base_url)._replace(path=f"/{name}"))
+    asyncio.run(_execute(base_url, f'CREATE DATABASE "{name}"'))
+    try:
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            monkeypatch.setenv("DATABASE_URL", url)
+            asyncio.run(migrate.migrate())
+            yield url
+    finally:
+        asyncio.run(_execute(base_url, f'DROP DATABASE IF EXISTS "{name}" WITH (FORCE)'))
+
+TRUNCATE_TABLES = f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE"
+
+@pytest.fixture
+async def db(database_url):
+    # Empty tables, and a pool that belongs to this test's event loop
+    await _execute(database_url, TRUNCATE_TABLES)
+    try:
+        yield database_url
+    finally:
+        await queries.close_pool()
+
+@pytest.fixture
+def client(database_url, monkeypatch):
+    # A TestClient over api.app on empty tables, with the in-process caches and
+    # loop-bound state of api.py reset for this test's app event loop
+    import api
+    from fastapi.testclient import TestClient
+
+    asyncio.run(_execute(database_url, TRUNCATE_TABLES))
+    monkeypatch.setattr(api, "_table_versions", {})
+    monkeypatch.setattr(api, "_redeemed", {})
+    monkeypatch.setattr(api, "_redeemed_loading", {})
+    monkeypatch.setattr(api, "_pending_redemptions", [])
+    monkeypatch.setattr(api, "_redemption_attempts", {})
+    monkeypatch.setattr(api, "_priced_meal_types", set())
+    monkeypatch.setattr(api, "_redemption_flush_requested", asyncio.Event())
+    with TestClient(api.app) as test_client: # Shutdown flushes redemptions and closes the pool
+        yield test_client
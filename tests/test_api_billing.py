@@ -0,0 +1,112 @@
+import csv
+import io
+
+import pytest
+
+RATES = [
+    {"meal_type": "Breakfast", "amount": "30.00"},
+    {"meal_type": "Lunch", "amount": "60.00"},
+    {"meal_type": "dinner", "amount": "55.50"}, # Meal types are normalized
+]
+
+@pytest.fixture
+def students(client):
+    # Two registered students, created through the same portal the app runs on
+    import queries
+
+    async def create():
+        return [
+            await queries.create_student("Asha", "ADM101", None, None, 101),
+            await queries.create_student("Ravi", "ADM102", None, None, 102),
+        ]
+
+    return client.portal.call(create)
+
+def record(student, date, meal_type, amount=None):
+    return {"student_id": student.id, "date": date, "meal_type": meal_type, "amount": amount}
+
+def test_records_are_priced_from_meal_rates(client, students):
+    asha, ravi = students
+    assert client.post("/billing/rates", json=RATES).json() == {"message": "Rates updated for Breakfast, Lunch, Dinner."}
+
+    response = client.post("/billing/records", json=[
+        record(asha, "2026-01-05", "Breakfast"),
+        record(asha, "2026-01-05", "lunch"),
+        record(ravi, "2026-01-05", "Dinner", "70.00"), # An explicit amount overrides the rate
+    ])
+    assert response.status_code == 200
+    assert response.json()["recorded"] == 3
+
+    bill = {row["name"]: row for row in client.get("/billing/2026-01").json()["students"]}
+    assert bill["Asha"]["total"] == "90.00"
+    assert bill["Ravi"]["total"] == "70.00"
+
+def test_duplicate_meal_in_a_batch_is_skipped(client, students):
+    asha, _ = students
+    client.post("/billing/rates", json=RATES)
+
+    response = client.post("/billing/records", json=[
+        record(asha, "2026-01-05", "Lunch"),
+        record(asha, "2026-01-05", "Lunch"),
+    ])
+    assert response.json() == {"message": "Recorded 1 meal(s).", "recorded": 1, "skipped": 1}
+
+    # Recording it again later is skipped as well
+    assert client.post("/billing/records", json=[record(asha, "2026-01-05", "Lunch")]).json()["recorded"] == 0
+
+def test_unknown_student_or_meal_is_rejected(client, students):
+    client.post("/billing/rates", json=RATES)
+    response = client.post("/billing/records", json=[{"student_id": 999, "date": "2026-01-05", "meal_type": "Lunch"}])
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("Unknown student")
+
+    assert client.post("/billing/records", json=[record(students[0], "2026-01-05", "Brunch")]).status_code == 400
+    # Snacks has no rate and no amount was given
+    assert client.post("/billing/records", json=[record(students[0], "2026-01-05", "Snacks")]).status_code == 400
+
+def test_monthly_totals(client, students):
+    asha, ravi = students
+    client.post("/billing/rates", json=RATES)
+    client.post("/billing/records", json=[
+        record(asha, "2026-01-01", "Breakfast"),
+        record(asha, "2026-01-01", "Lunch"),
+        record(asha, "2026-01-31", "Dinner"),
+        record(ravi, "2026-01-15", "Lunch"),
+        record(ravi, "2025-12-31", "Lunch"), # Outside the month
+        record(ravi, "2026-02-01", "Lunch"), # Outside the month
+    ])
+
+    bill = client.get("/billing/2026-01").json()
+    assert bill["month"] == "2026-01"
+    assert bill["total"] == "205.50"
+    assert bill["students"] == [
+        {"student_id": asha.id, "name": "Asha", "admission_no": "ADM101",
+         "breakfast": 1, "lunch": 1, "snacks": 0, "dinner": 1, "meals": 3, "total": "145.50"},
+        {"student_id": ravi.id, "name": "Ravi", "admission_no": "ADM102",
+         "breakfast": 0, "lunch": 1, "snacks": 0, "dinner": 0, "meals": 1, "total": "60.00"},
+    ]
+    assert client.get("/billing/2026-03").json() == {"month": "2026-03", "students": [], "total": "0"}
+
+def test_csv_export(client, students):
+    asha, ravi = students
+    client.post("/billing/rates", json=RATES)
+    client.post("/billing/records", json=[
+        record(asha, "2026-01-01", "Breakfast"),
+        record(ravi, "2026-01-02", "Dinner"),
+        record(ravi, "2026-01-03", "Dinner"),
+    ])
+
+    response = client.get("/billing/2026-01/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"] == 'attachment; filename="mess-bill-2026-01.csv"'
+    assert list(csv.reader(io.StringIO(response.text))) == [
+        ["student_id", "name", "admission_no", "breakfast", "lunch", "snacks", "dinner", "meals", "total"],
+        [str(asha.id), "Asha", "ADM101", "1", "0", "0", "0", "1", "30.00"],
+        [str(ravi.id), "Ravi", "ADM102", "0", "0", "0", "2", "2", "111.00"],
+    ]
+
+@pytest.mark.parametrize("month", ["2026-13", "26-01", "january", "9999-12"])
+def test_invalid_month_is_rejected(client, month):
+    assert client.get(f"/billing/{month}").status_code == 400
+    assert client.get(f"/billing/{month}/export").status_code == 400
@@ -0,0 +1,48 @@
+from fastapi.testclient import TestClient
+
+import api
+import queries
+
+def test_not_modified_skips_the_database(monkeypatch):
+    calls = []
+
+    async def get_table_versions(table_names, conn=None):
+        calls.append("table_versions")
+        return {name: 7 for name in table_names}
+
+    async def get_menu(weekday, conn=None):
+        calls.append("menu")
+        return queries.DayMenu(weekday, "Idli", "Rice", None, "Chapati")
+
+    monkeypatch.setattr(queries, "get_table_versions", get_table_versions)
+    monkeypatch.setattr(queries, "get_menu", get_menu)
+    monkeypatch.setattr(api, "_table_versions", {})
+    client = TestClient(api.app)
+
+    first = client.get("/menu/Monday")
+    assert first.status_code == 200
+    assert calls == ["table_versions", "menu"]
+
+    calls.clear()
+    second = client.get("/menu/Monday", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 304
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert calls == [] # versions came from the in-process cache, and the menu was not read
+
+def test_etag_differs_per_content_coding(monkeypatch):
+    async def get_table_versions(table_names, conn=None):
+        return {name: 1 for name in table_names}
+
+    async def get_menu(weekday, conn=None):
+        return queries.DayMenu(weekday, "Idli", None, None, None)
+
+    monkeypatch.setattr(queries, "get_table_versions", get_table_versions)
+    monkeypatch.setattr(queries, "get_menu", get_menu)
+    client = TestClient(api.app)
+
+    etags = {
+        coding: client.get("/menu/Monday", headers={"Accept-Encoding": coding}).headers["ETag"]
+        for coding in ["identity", "gzip", "br"]
+    }
+    assert len(set(etags.values())) == 3
+    assert not any(etag.startswith("W/") for etag in etags.values())
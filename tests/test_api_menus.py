@@ -0,0 +1,43 @@
+CSV_HEADER = "weekday,breakfast,lunch,snacks,dinner\n"
+
+def post_csv(client, body):
+    return client.post("/menus", content=CSV_HEADER + body, headers={"Content-Type": "text/csv"})
+
+def test_json_null_clears_a_meal(client):
+    assert client.post("/menus", json=[{"weekday": "monday", "breakfast": "Idli", "lunch": "Rice"}]).status_code == 200
+
+    response = client.post("/menus", json=[{"weekday": "monday", "breakfast": "Idli", "lunch": None}])
+    assert response.status_code == 200
+    assert response.json()["weekdays"] == ["Monday"]
+    assert client.get("/menu/Monday").json() == {
+        "weekday": "Monday", "breakfast": "Idli", "lunch": None, "snacks": None, "dinner": None,
+    }
+
+def test_blank_csv_cell_keeps_the_stored_meal(client):
+    client.post("/menus", json=[{"weekday": "Tuesday", "breakfast": "Poha", "lunch": "Biryani", "dinner": "Roti"}])
+
+    response = post_csv(client, "Tuesday,Upma,,Samosa,\nWednesday,Dosa,Dal,,\n")
+    assert response.status_code == 200
+    assert response.json()["weekdays"] == ["Tuesday", "Wednesday"]
+
+    assert client.get("/menus").json() == [
+        {"weekday": "Tuesday", "breakfast": "Upma", "lunch": "Biryani", "snacks": "Samosa", "dinner": "Roti"},
+        {"weekday": "Wednesday", "breakfast": "Dosa", "lunch": "Dal", "snacks": None, "dinner": None},
+    ]
+
+def test_unknown_weekday_is_rejected(client):
+    response = client.post("/menus", json=[{"weekday": "Funday", "breakfast": "Cake"}])
+    assert response.status_code == 400
+    assert post_csv(client, "Someday,Idli,,,\n").status_code == 400
+    assert client.get("/menus").json() == []
+
+def test_duplicate_weekday_is_rejected(client):
+    response = client.post("/menus", json=[{"weekday": "Friday", "lunch": "Rice"}, {"weekday": "friday", "lunch": "Pulao"}])
+    assert response.status_code == 400
+    assert post_csv(client, "Friday,Idli,,,\nFriday,Dosa,,,\n").status_code == 400
+    assert client.get("/menus").json() == []
+
+def test_empty_or_malformed_upload_is_rejected(client):
+    assert client.post("/menus", json=[]).status_code == 400
+    assert post_csv(client, "").status_code == 400
+    assert client.post("/menus", content="not json", headers={"Content-Type": "application/json"}).status_code == 400
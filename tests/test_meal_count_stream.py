@@ -0,0 +1,74 @@
+import asyncio
+import contextlib
+import datetime
+import json
+
+import pytest
+
+import api
+import queries
+
+pytestmark = pytest.mark.anyio
+
+def parse_event(message):
+    event, data = message.strip().split("\n")
+    return event.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+@pytest.fixture
+def stream_state(monkeypatch):
+    # The stream's module-level queue and lock bind to the first event loop that waits on them;
+    # every test runs on its own loop
+    monkeypatch.setattr(api, "_stream_notifications", asyncio.Queue())
+    monkeypatch.setattr(api, "_stream_lock", asyncio.Lock())
+    monkeypatch.setattr(api, "_stream_subscribers", set())
+    monkeypatch.setattr(api, "_stream_snapshot", {"date": None, "choices": {}})
+
+@contextlib.asynccontextmanager
+async def subscription():
+    # The same subscription /mealcount/stream hands to each client. The endpoint itself is not
+    # driven through TestClient, which buffers the whole (never-ending) response body.
+    queue = await api.subscribe_to_meal_counts()
+    try:
+        yield queue
+    finally:
+        if api._stream_listener is not None:
+            await api._stream_listener.close() # on_listener_terminated stops the worker
+
+async def next_event(queue):
+    return parse_event(await asyncio.wait_for(queue.get(), 5))
+
+async def test_stream_sends_snapshot_then_delta(db, stream_state):
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+    # Registered before subscribing, so the student is part of the snapshot
+    asha = await queries.create_student("Asha", "ADM101", None, None, 101)
+    async with subscription() as queue:
+        event, snapshot = await next_event(queue)
+        assert event == "snapshot"
+        assert snapshot["date"] == tomorrow.isoformat()
+        assert snapshot["non_veg_students"] == ["Asha"]
+
+        await queries.save_meal_choice(asha.id, tomorrow, "Veg", "Tea")
+        event, delta = await next_event(queue)
+        assert event == "delta"
+        assert delta == {
+            "date": tomorrow.isoformat(),
+            "student_id": asha.id,
+            "previous": {"name": "Asha", "veg_or_nonveg": "Non-Veg", "caffeine_choice": "None"},
+            "current": {"name": "Asha", "veg_or_nonveg": "Veg", "caffeine_choice": "Tea"},
+        }
+
+async def test_stream_adds_new_students(db, stream_state):
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+    async with subscription() as queue:
+        event, snapshot = await next_event(queue)
+        assert (event, snapshot["non_veg"]) == ("snapshot", 0)
+
+        ravi = await queries.create_student("Ravi", "ADM102", None, None, 102)
+        event, delta = await next_event(queue)
+        assert event == "delta"
+        assert delta == {
+            "date": tomorrow.isoformat(),
+            "student_id": ravi.id,
+            "previous": None,
+            "current": {"name": "Ravi", "veg_or_nonveg": "Non-Veg", "caffeine_choice": "None"},
+        }
@@ -0,0 +1,135 @@
+import asyncio
+import datetime
+import json
+
+import asyncpg
+import pytest
+
+import queries
+
+pytestmark = pytest.mark.anyio
+
+WEDNESDAY = datetime.date(2026, 1, 7)
+
+async def add_student(name="Asha", tg_user_id=101):
+    return await queries.create_student(name, f"ADM{tg_user_id}", 2027, None, tg_user_id)
+
+async def test_students_come_back_as_typed_records(db):
+    created = await add_student()
+    assert isinstance(created, queries.Student)
+    assert (created.name, created.admission_no, created.passout_year, created.tg_user_id) == ("Asha", "ADM101", 2027, 101)
+
+    assert await queries.get_student_by_tg_user(101) == created
+    assert await queries.get_student(created.id) == created
+    assert await queries.list_students() == [created]
+    assert await queries.get_student_by_tg_user(999) is None
+
+async def test_duplicate_student_raises_unique_violation(db):
+    await add_student()
+    with pytest.raises(asyncpg.exceptions.UniqueViolationError):
+        await add_student()
+
+async def test_menus_upsert_and_merge(db):
+    await queries.upsert_menus([queries.DayMenu("Monday", "Idli", "Rice", None, "Chapati")])
+    assert await queries.get_menu("Monday") == queries.DayMenu("Monday", "Idli", "Rice", None, "Chapati")
+
+    await queries.upsert_menus([queries.DayMenu("Monday", "Dosa", None, None, None)], keep_missing=True)
+    assert await queries.get_menu("Monday") == queries.DayMenu("Monday", "Dosa", "Rice", None, "Chapati")
+
+    await queries.upsert_menus([queries.DayMenu("Monday", "Poha", None, None, None)])
+    assert await queries.list_menus() == [queries.DayMenu("Monday", "Poha", None, None, None)]
+    assert await queries.get_menu("Sunday") is None
+
+async def test_choice_upserts_send_notifications(db):
+    student = await add_student()
+    received = asyncio.Queue()
+    listener = await queries.connect()
+    await listener.add_listener(queries.MEALCOUNT_CHANNEL, lambda conn, pid, channel, payload: received.put_nowait(payload))
+    try:
+        await queries.save_meal_choice(student.id, WEDNESDAY, "Veg", "Tea")
+        await queries.save_meal_choice(student.id, WEDNESDAY, "Non-Veg", "Coffee") # Upserts the same row
+        await queries.save_weekly_choice(student.id, "Friday", "Veg", "None")
+
+        payloads = [json.loads(await asyncio.wait_for(received.get(), 5)) for _ in range(3)]
+    finally:
+        await listener.close()
+
+    date = WEDNESDAY.isoformat()
+    assert payloads == [
+        {"table": "meal_choices", "student_id": student.id, "date": date},
+        {"table": "meal_choices", "student_id": student.id, "date": date},
+        {"table": "weekly_choices", "student_id": student.id, "weekday": "Friday"},
+    ]
+    assert await queries.resolve_choice(student.id, WEDNESDAY) == queries.MealChoice("Non-Veg", "Coffee")
+
+async def test_create_student_sends_notification(db):
+    received = asyncio.Queue()
+    listener = await queries.connect()
+    await listener.add_listener(queries.MEALCOUNT_CHANNEL, lambda conn, pid, channel, payload: received.put_nowait(payload))
+    try:
+        student = await add_student()
+        payload = json.loads(await asyncio.wait_for(received.get(), 5))
+    finally:
+        await listener.close()
+    assert payload == {"table": "students", "student_id": student.id}
+
+async def test_resolve_choice_precedence(db):
+    student = await add_student()
+    assert await queries.resolve_choice(student.id, WEDNESDAY) == queries.MealChoice("Non-Veg", "None", is_default=True)
+
+    # A weekly choice without veg/non-veg still counts as the default, but keeps its caffeine
+    await queries.save_weekly_choice(student.id, "Wednesday", None, "Tea")
+    assert await queries.resolve_choice(student.id, WEDNESDAY) == queries.MealChoice("Non-Veg", "Tea", is_default=True)
+
+    await queries.save_weekly_choice(student.id, "Wednesday", "Veg", "Coffee")
+    assert await queries.resolve_choice(student.id, WEDNESDAY) == queries.MealChoice("Veg", "Coffee")
+    assert await queries.resolve_choice(student.id, WEDNESDAY + datetime.timedelta(days=1)) == queries.MealChoice("Non-Veg", "None", is_default=True)
+
+    await queries.save_meal_choice(student.id, WEDNESDAY, "Non-Veg", "Black Tea")
+    assert await queries.resolve_choice(student.id, WEDNESDAY) == queries.MealChoice("Non-Veg", "Black Tea")
+
+async def test_batch_and_joined_resolution_agree(db):
+    asha = await add_student("Asha", 101)
+    ravi = await add_student("Ravi", 102)
+    await queries.save_meal_choice(asha.id, WEDNESDAY, "Veg", "Tea")
+    await queries.save_weekly_choice(ravi.id, "Thursday", "Veg", "Coffee")
+    thursday = WEDNESDAY + datetime.timedelta(days=1)
+
+    choices = await queries.resolve_choices([(asha.id, WEDNESDAY), (ravi.id, WEDNESDAY), (ravi.id, thursday)])
+    assert choices == {
+        (asha.id, WEDNESDAY): queries.MealChoice("Veg", "Tea"),
+        (ravi.id, WEDNESDAY): queries.MealChoice("Non-Veg", "None", is_default=True),
+        (ravi.id, thursday): queries.MealChoice("Veg", "Coffee"),
+    }
+    assert await queries.get_student_with_choice(101, WEDNESDAY) == (asha, choices[(asha.id, WEDNESDAY)])
+    assert await queries.get_student_with_choice(999, WEDNESDAY) is None
+    assert sorted(await queries.list_students_with_choices(WEDNESDAY), key=lambda pair: pair[0].id) == [
+        (asha, choices[(asha.id, WEDNESDAY)]),
+        (ravi, choices[(ravi.id, WEDNESDAY)]),
+    ]
+
+async def test_timing_hooks_see_every_statement(db):
+    timings = []
+    hook = lambda name, elapsed: timings.append((name, elapsed))
+    queries.add_timing_hook(hook)
+    try:
+        await queries.get_student_by_tg_user(101)
+        await queries.list_menus()
+    finally:
+        queries.remove_timing_hook(hook)
+    await queries.list_menus()
+
+    assert [name for name, _ in timings] == ["student_by_tg_user", "all_menus"]
+    assert all(elapsed >= 0 for _, elapsed in timings)
+
+async def test_timing_hooks_run_for_failed_statements(db):
+    names = []
+    hook = lambda name, elapsed: names.append(name)
+    await add_student()
+    queries.add_timing_hook(hook)
+    try:
+        with pytest.raises(asyncpg.exceptions.UniqueViolationError):
+            await add_student()
+    finally:
+        queries.remove_timing_hook(hook)
+    assert names == ["insert_student"]
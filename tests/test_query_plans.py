@@ -0,0 +1,92 @@
+import datetime
+import json
+
+import pytest
+
+import queries
+
+pytestmark = pytest.mark.anyio
+
+# Query-plan regression checks for the hot per-day lookups: they must read a single monthly
+# meal_choices partition through meal_choices_date_idx and find weekly fallbacks through
+# weekly_choices_weekday_idx (see migrations/0004_partition_meal_choices.sql).
+
+STUDENTS = 2000
+TOMORROW = datetime.date.today() + datetime.timedelta(days=1)
+
+@pytest.fixture
+async def seeded(db):
+    async with queries.acquire() as conn:
+        await conn.execute(
+            """
+            INSERT INTO students (name, admission_no, tg_user_id)
+            SELECT 'Student ' || n, 'ADM' || n, n FROM generate_series(1, $1) AS n
+            """,
+            STUDENTS
+        )
+        # Three weeks of daily choices around tomorrow, usually spanning two monthly partitions
+        await conn.execute(
+            """
+            INSERT INTO meal_choices (student_id, date, veg_or_nonveg, caffeine_choice)
+            SELECT s.id, $1::date + offset_days, CASE WHEN s.id % 3 = 0 THEN 'Veg' ELSE 'Non-Veg' END, 'Tea'
+            FROM students s, generate_series(-10, 10) AS offset_days
+            WHERE (s.id + offset_days) % 4 <> 0
+            """,
+            TOMORROW
+        )
+        await conn.execute(
+            """
+            INSERT INTO weekly_choices (student_id, weekday, veg_or_nonveg, caffeine_choice)
+            SELECT s.id, weekday, 'Veg', 'Coffee'
+            FROM students s,
+                 unnest(ARRAY['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']) AS weekday
+            """
+        )
+        await conn.execute("ANALYZE students, meal_choices, weekly_choices")
+        yield conn
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+async def explain(conn, statement, *args):
+    # The statement runs with its real parameters, as the app would
+    result = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {queries.STATEMENTS[statement]}", *args)
+    return list(plan_nodes(json.loads(result)[0]["Plan"]))
+
+def scanned_relations(nodes):
+    return {node["Relation Name"] for node in nodes if "Relation Name" in node}
+
+async def used_indexes(conn, nodes):
+    # Indexes on partitions are reported by their own names; map them to the index on meal_choices
+    names = [node["Index Name"] for node in nodes if "Index Name" in node]
+    rows = await conn.fetch(
+        "SELECT COALESCE(pg_partition_root(to_regclass(name))::text, name) AS root FROM unnest($1::text[]) AS name",
+        names
+    )
+    return {row["root"] for row in rows}
+
+async def assert_hot_path(conn, nodes):
+    meal_choice_partitions = {
+        relation for relation in scanned_relations(nodes) if relation.startswith("meal_choices")
+    }
+    assert meal_choice_partitions == {f"meal_choices_{TOMORROW:%Y_%m}"}
+    indexes = await used_indexes(conn, nodes)
+    assert "meal_choices_date_idx" in indexes
+    assert "weekly_choices_weekday_idx" in indexes
+
+async def test_meal_count_query_prunes_partitions_and_uses_indexes(seeded):
+    await assert_hot_path(seeded, await explain(seeded, "students_with_choices", TOMORROW))
+
+async def test_ticket_query_prunes_partitions_and_uses_indexes(seeded):
+    nodes = await explain(seeded, "student_with_choice_by_tg_user", 42, TOMORROW)
+    await assert_hot_path(seeded, nodes)
+    assert not any(node["Node Type"] == "Seq Scan" for node in nodes)
+
+async def test_weekday_fallback_uses_weekday_index(seeded):
+    # A batch for one student on every day of tomorrow's week, resolved through effective_choice()
+    week = [TOMORROW + datetime.timedelta(days=offset) for offset in range(7)]
+    nodes = await explain(seeded, "effective_choices", [1] * len(week), week)
+    assert "weekly_choices_weekday_idx" in await used_indexes(seeded, nodes)
+    assert "weekly_choices" not in {node.get("Relation Name") for node in nodes if node["Node Type"] == "Seq Scan"}
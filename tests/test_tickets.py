@@ -0,0 +1,123 @@
+import datetime
+
+import pytest
+
+import api
+import queries
+import tickets
+
+TODAY = datetime.date(2026, 1, 7)
+
+@pytest.fixture(autouse=True)
+def ticket_secret(monkeypatch):
+    monkeypatch.setenv("TICKET_SECRET", "test-secret")
+
+def test_sign_and_verify_round_trip():
+    token = tickets.sign_ticket(42, TODAY, "Veg", "Black Coffee")
+    assert token.startswith("42.260107.VBC.")
+    assert tickets.verify_ticket(token) == {
+        "student_id": 42, "date": TODAY, "veg_or_nonveg": "Veg", "caffeine_choice": "Black Coffee",
+    }
+    assert tickets.verify_ticket(f"  {token}\n")["student_id"] == 42 # Scanners may add whitespace
+
+def test_tampered_signature_is_rejected():
+    token = tickets.sign_ticket(42, TODAY, "Veg", "Tea")
+    last = token[-1]
+    with pytest.raises(tickets.InvalidTicket):
+        tickets.verify_ticket(token[:-1] + ("A" if last != "A" else "B"))
+
+def test_tampered_payload_is_rejected():
+    token = tickets.sign_ticket(42, TODAY, "Veg", "Tea")
+    with pytest.raises(tickets.InvalidTicket):
+        tickets.verify_ticket(token.replace("42.", "43.", 1))
+    with pytest.raises(tickets.InvalidTicket):
+        tickets.verify_ticket(token.replace(".VT.", ".NT.", 1))
+
+def test_signature_depends_on_the_secret(monkeypatch):
+    token = tickets.sign_ticket(42, TODAY, "Veg", "Tea")
+    monkeypatch.setenv("TICKET_SECRET", "another-secret")
+    with pytest.raises(tickets.InvalidTicket):
+        tickets.verify_ticket(token)
+
+@pytest.mark.parametrize("token", ["x.é", "42.260107.VT.ünïcödé-signatur", "é"])
+def test_non_ascii_token_is_invalid(token):
+    with pytest.raises(tickets.InvalidTicket):
+        tickets.verify_ticket(token)
+
+@pytest.mark.parametrize("token", ["", ".", "garbage", "42.260107.VT", "42.260107.VT.", "a.b.c.d.e"])
+def test_malformed_token_is_invalid(token):
+    with pytest.raises(tickets.InvalidTicket):
+        tickets.verify_ticket(token)
+
+def test_validly_signed_but_malformed_payload_is_invalid():
+    # A correct signature over something that is not a ticket
+    message = "42.2601xx.VT"
+    with pytest.raises(tickets.InvalidTicket, match="Malformed"):
+        tickets.verify_ticket(f"{message}.{tickets._signature(message)}")
+
+def test_missing_secret(monkeypatch):
+    monkeypatch.delenv("TICKET_SECRET")
+    with pytest.raises(tickets.MissingTicketSecret):
+        tickets.sign_ticket(42, TODAY, "Veg", "Tea")
+
+# --- /verify --- #
+
+@pytest.fixture
+def student(client):
+    return client.portal.call(queries.create_student, "Asha", "ADM101", None, None, 101)
+
+@pytest.fixture
+def today(monkeypatch):
+    # /verify works on the Kolkata date; pin it so the test does not straddle midnight
+    monkeypatch.setattr(api, "ticket_today", lambda: TODAY)
+    return TODAY
+
+def scan(client, token, meal_type="Lunch"):
+    return client.post("/verify", json={"token": token, "meal_type": meal_type})
+
+def test_verify_sequence(client, student, today):
+    client.post("/billing/rates", json=[{"meal_type": "Lunch", "amount": "60.00"}])
+    token = tickets.sign_ticket(student.id, today, "Veg", "Tea")
+
+    first = scan(client, token)
+    assert first.status_code == 200
+    assert first.json() == {
+        "status": "ok", "meal_type": "Lunch", "student_id": student.id,
+        "veg_or_nonveg": "Veg", "caffeine_choice": "Tea",
+    }
+    assert scan(client, token).status_code == 409
+    # A re-issued ticket for the same student and meal is refused too
+    assert scan(client, tickets.sign_ticket(student.id, today, "Non-Veg", "None")).status_code == 409
+
+    unpriced = scan(client, token, meal_type="Dinner")
+    assert unpriced.status_code == 503
+    assert "No rate is set for Dinner" in unpriced.json()["detail"]
+
+    yesterday = tickets.sign_ticket(student.id, today - datetime.timedelta(days=1), "Veg", "Tea")
+    assert scan(client, yesterday).status_code == 410
+
+def test_redemption_survives_a_restart(client, student, today, monkeypatch):
+    client.post("/billing/rates", json=[{"meal_type": "Lunch", "amount": "60.00"}])
+    token = tickets.sign_ticket(student.id, today, "Veg", "Tea")
+    assert scan(client, token).status_code == 200
+
+    client.portal.call(api.flush_redemptions)
+    bill = client.get("/billing/2026-01").json()
+    assert bill["total"] == "60.00"
+
+    # A fresh process only knows what is in mess_records
+    monkeypatch.setattr(api, "_redeemed", {})
+    assert scan(client, token).status_code == 409
+
+@pytest.mark.parametrize("token", ["x.é", "not-a-ticket", ""])
+def test_verify_rejects_bad_tokens_with_403(client, token):
+    assert scan(client, token).status_code == 403
+
+def test_verify_without_secret_is_503(client, monkeypatch):
+    monkeypatch.delenv("TICKET_SECRET")
+    response = scan(client, "42.260107.VT.AAAAAAAAAAAAAAAA")
+    assert response.status_code == 503
+    assert "TICKET_SECRET" in response.json()["detail"]
+
+def test_verify_rejects_unknown_meal_type(client, student, today):
+    assert scan(client, tickets.sign_ticket(student.id, today, "Veg", "Tea"), meal_type="Brunch").status_code == 400
@@ -0,0 +1,53 @@
+import base64
+import datetime
+import hashlib
+import hmac
+import os
+
+# Compact signed ticket tokens, shared by bot.py (which issues them) and api.py (which verifies them).
+# Format: "<student_id>.<yymmdd>.<veg code><caffeine code>.<signature>", e.g. "42.261019.VBC.Xq3...".
+# The signature is a truncated HMAC-SHA256 over everything before it, keyed with TICKET_SECRET.
+
+VEG_CODES = {"Veg": "V", "Non-Veg": "N"}
+CAFFEINE_CODES = {"Tea": "T", "Coffee": "C", "Black Coffee": "BC", "Black Tea": "BT", "None": "X"}
+SIGNATURE_LENGTH = 16 # base64url characters, i.e. 96 bits of the HMAC
+
+VEG_NAMES = {code: name for name, code in VEG_CODES.items()}
+CAFFEINE_NAMES = {code: name for name, code in CAFFEINE_CODES.items()}
+
+class InvalidTicket(Exception):
+    pass
+
+class MissingTicketSecret(RuntimeError):
+    pass
+
+def get_ticket_secret() -> bytes:
+    secret = os.getenv("TICKET_SECRET")
+    if not secret:
+        raise MissingTicketSecret("TICKET_SECRET is not set.")
+    return secret.encode()
+
+def _signature(message: str) -> str:
+    digest = hmac.new(get_ticket_secret(), message.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode()[:SIGNATURE_LENGTH]
+
+def sign_ticket(student_id: int, date: datetime.date, veg_or_nonveg: str, caffeine_choice: str) -> str:
+    message = f"{student_id}.{date:%y%m%d}.{VEG_CODES[veg_or_nonveg]}{CAFFEINE_CODES[caffeine_choice]}"
+    return f"{message}.{_signature(message)}"
+
+def verify_ticket(token: str) -> dict:
+    # Checks the signature and decodes the token; raises InvalidTicket if anything is off
+    message, _, signature = token.strip().rpartition(".")
+    # Compared as bytes: compare_digest rejects str arguments with non-ASCII characters
+    if not message or not hmac.compare_digest(signature.encode(), _signature(message).encode()):
+        raise InvalidTicket("Signature does not match.")
+    try:
+        student_id, date, choice = message.split(".")
+        return {
+            "student_id": int(student_id),
+            "date": datetime.datetime.strptime(date, "%y%m%d").date(),
+            "veg_or_nonveg": VEG_NAMES[choice[0]],
+            "caffeine_choice": CAFFEINE_NAMES[choice[1:]],
+        }
+    except (ValueError, KeyError, IndexError):
+        raise InvalidTicket("Malformed ticket.")